@@ -0,0 +1,136 @@
+"""
+Reproducible search benchmark.
+Runs naive_partial_match, naive_levenshtein_distance, pure_model and mixed_model over a fixed sample of evaluation
+queries and reports cold start time, per-query latency percentiles, batched throughput and peak RSS.
+Output: stats/benchmark-[MODEL]-[TIMESTAMP].json
+Usage: python benchmark.py [MODEL NAME] (srd) (tf)
+"""
+import time
+
+START = time.perf_counter()
+
+import json
+import platform
+import random
+import resource
+import sys
+
+import numpy as np
+
+from fuzzy_index import fuzzy_index_for
+from preprocess import MAGIC_1, MAGIC_2
+from ranking import top_k
+from spell_evaluation import (load_choices, load_evaluation_queries, load_map, load_model, mixed_model,
+                              naive_levenshtein_distance, naive_partial_match, prepare_input, pure_model)
+
+NUM_QUERIES = 2000
+NUM_WARMUP = 50
+BATCH_SIZES = (1, 8, 64, 512)
+SEED = 0
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def latency_stats(latencies):
+    latencies = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    return {
+        'mean_ms': float(latencies.mean()),
+        'p50_ms': float(p50),
+        'p95_ms': float(p95),
+        'p99_ms': float(p99),
+        'max_ms': float(latencies.max()),
+        'queries_per_second': float(1000 / latencies.mean())
+    }
+
+
+def bench_latency(search, queries, choices, *model_args):
+    for query in queries[:NUM_WARMUP]:
+        search(choices, query, *model_args)
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        search(choices, query, *model_args)
+        latencies.append(time.perf_counter() - start)
+    return latency_stats(latencies)
+
+
+def bench_throughput(queries, model, magic_string, model_name):
+    """Queries per second of tokenize + predict + top 10 at each batch size."""
+    out = {}
+    for batch_size in BATCH_SIZES:
+        batches = [queries[i:i + batch_size] for i in range(0, len(queries), batch_size)]
+        model.predict(prepare_input(batches[0], magic_string, model_name))
+        start = time.perf_counter()
+        for batch in batches:
+            top_k(model.predict(prepare_input(batch, magic_string, model_name)), 10)
+        out[batch_size] = len(queries) / (time.perf_counter() - start)
+    return out
+
+
+def run(model_name):
+    results = {
+        'model': model_name,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'argv': sys.argv[1:],
+        'cold_start': {'imports_s': time.perf_counter() - START}
+    }
+
+    cold_start = results['cold_start']
+    start = time.perf_counter()
+    model = load_model(model_name)
+    cold_start['load_model_s'] = time.perf_counter() - start
+    start = time.perf_counter()
+    load_map()
+    choices = load_choices()
+    cold_start['load_map_and_choices_s'] = time.perf_counter() - start
+    start = time.perf_counter()
+    fuzzy_index_for(choices)
+    cold_start['build_fuzzy_index_s'] = time.perf_counter() - start
+    magic_string = MAGIC_1 if model_name.startswith('magic1') else MAGIC_2
+    start = time.perf_counter()
+    pure_model(choices, 'fireball', model, magic_string, model_name)
+    cold_start['first_query_s'] = time.perf_counter() - start
+    cold_start['total_s'] = time.perf_counter() - START
+    results['peak_rss_mb'] = {'after_load': peak_rss_mb()}
+
+    query_pairs = load_evaluation_queries()
+    queries = [query for query, _ in random.Random(SEED).sample(query_pairs, min(NUM_QUERIES, len(query_pairs)))]
+    results['num_queries'] = len(queries)
+
+    results['latency'] = {
+        'naive_partial_match': bench_latency(naive_partial_match, queries, choices),
+        'naive_levenshtein_distance': bench_latency(naive_levenshtein_distance, queries, choices),
+        'pure_model': bench_latency(pure_model, queries, choices, model, magic_string, model_name),
+        'mixed_model': bench_latency(mixed_model, queries, choices, model, magic_string, model_name)
+    }
+    results['pure_model_throughput'] = bench_throughput(queries, model, magic_string, model_name)
+    results['peak_rss_mb']['end'] = peak_rss_mb()
+    return results
+
+
+if __name__ == '__main__':
+    args = [a for a in sys.argv[1:] if a not in ('srd', 'tf')]
+    model_name = args[0] if args else input("Model name? ").strip()
+    results = run(model_name)
+
+    print(f"Cold start: {results['cold_start']['total_s']:.3f}s "
+          f"({', '.join(f'{k}={v:.3f}' for k, v in results['cold_start'].items() if k != 'total_s')})")
+    print(f"{'Method':<30}{'p50':>10}{'p95':>10}{'p99':>10}{'q/s':>10}")
+    for method, stats in results['latency'].items():
+        print(f"{method:<30}{stats['p50_ms']:>8.3f}ms{stats['p95_ms']:>8.3f}ms{stats['p99_ms']:>8.3f}ms"
+              f"{stats['queries_per_second']:>10.0f}")
+    print("Pure model throughput: " + ', '.join(f"batch {batch_size}: {qps:.0f} q/s"
+                                                for batch_size, qps in results['pure_model_throughput'].items()))
+    print(f"Peak RSS: {results['peak_rss_mb']['end']:.1f} MB")
+
+    outfile = f"stats/benchmark-{model_name}-{time.strftime('%Y%m%d-%H%M%S')}.json"
+    with open(outfile, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Wrote {outfile}")
@@ -13,22 +13,25 @@ magic1_embedding_conv_smaller Pure: t1=12979 t2=1172 t3=470 t10=976 f=1330 t=39.
 magic1_embedding_conv_smaller Mixed: t1=12814 t2=961 t3=495 t10=1546 f=1111 t=163.57
 """
 
-import json
 import sys
 
-import numpy as np
 from tensorflow import keras
 
+import training_pipeline
+from preprocess import load_dataset
+
 SRD = 'srd' in sys.argv
+WEIGHTED = 'weighted' in sys.argv  # weight each unique query by how many times it was searched
 
-with open(f'training/embedding-{"srd-" if SRD else ""}mar2019_861k_spell.json') as f:
-    data = json.load(f)
+data = load_dataset(f'training/{"srd-" if SRD else ""}mar2019_861k_spell')
 
-train_queries = np.array([spell['x'] for spell in data])  # 16d list of integers
-train_labels = np.array([spell['y'] for spell in data])  # 501d vector
+train_queries = training_pipeline.token_inputs(data['x1'])  # 16d list of integers
+train_labels = training_pipeline.SoftLabels(data)  # 501d vector
+num_rows = len(data['x1'])
+sample_weights = training_pipeline.count_weights(data) if WEIGHTED else None
 
-print(f"X shape: {train_queries.shape}")
-print(f"Y shape: {train_labels.shape}")
+print(f"X shape: {data['x1'].shape}")
+print(f"Y shape: {(num_rows, train_labels.num_classes)}")
 
 model = keras.Sequential([
     keras.layers.Embedding(29, 16, input_length=16),
@@ -38,7 +41,7 @@ model = keras.Sequential([
     keras.layers.Flatten(),
     # keras.layers.Dense(128, activation='relu'),
     keras.layers.Dropout(0.2),
-    keras.layers.Dense(298 if SRD else 501, activation='softmax')
+    keras.layers.Dense(train_labels.num_classes, activation='softmax')
 ])
 
 model.compile(optimizer=keras.optimizers.Adam(lr=0.001),
@@ -47,17 +50,19 @@ model.compile(optimizer=keras.optimizers.Adam(lr=0.001),
 
 model.summary()
 
-model.fit(x=train_queries, y=train_labels, epochs=1000, validation_split=0.05, shuffle=True,
-          callbacks=[
-              keras.callbacks.TensorBoard(log_dir='./logs', histogram_freq=0, batch_size=32, write_graph=True,
-                                          write_grads=True, write_images=True, embeddings_freq=0,
-                                          embeddings_layer_names=None, embeddings_metadata=None, embeddings_data=None,
-                                          update_freq='epoch'),
-              # keras.callbacks.ReduceLROnPlateau('val_loss', patience=10, verbose=1, min_lr=0.0002),
-              keras.callbacks.EarlyStopping('val_loss', min_delta=0, patience=40, verbose=1)
-          ])
-
-test_loss, test_acc = model.evaluate(train_queries, train_labels)
+callbacks = [
+    keras.callbacks.TensorBoard(log_dir='./logs', histogram_freq=0, batch_size=32, write_graph=True,
+                                write_grads=True, write_images=True, embeddings_freq=0,
+                                embeddings_layer_names=None, embeddings_metadata=None, embeddings_data=None,
+                                update_freq='epoch'),
+    # keras.callbacks.ReduceLROnPlateau('val_loss', patience=10, verbose=1, min_lr=0.0002),
+    keras.callbacks.EarlyStopping('val_loss', min_delta=0, patience=40, verbose=1)
+]
+
+training_pipeline.fit(model, train_queries, train_labels, num_rows, epochs=1000, validation_split=0.05,
+                      callbacks=callbacks, weights=sample_weights)
+
+test_loss, test_acc = training_pipeline.evaluate(model, train_queries, train_labels, num_rows)
 print('Test accuracy:', test_acc)
 
 fileout = input("Save weights? (enter weight name) ")
@@ -0,0 +1,36 @@
+"""
+Nearest-neighbour index over vectors of choice names.
+The vectors come from a trained model's penultimate activations (NumpyModel.features), so a query is matched against
+every name in the model's own feature space. Names added after training can be searched by adding their vectors, with
+no retraining.
+"""
+import numpy as np
+
+from ranking import top_k
+
+
+class EmbeddingIndex:
+    def __init__(self, vectors):
+        """
+        :param vectors: (num names, dims) array of name vectors, in choice order.
+        """
+        self.vectors = np.zeros((0, vectors.shape[1]), dtype=np.float32)
+        self.add(vectors)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def add(self, vectors):
+        """Appends vectors for new names, which get the next indices."""
+        self.vectors = np.concatenate([self.vectors, normalize(vectors)])
+
+    def search(self, vector, k=10):
+        """Returns (indices, cosine similarities) of the k names closest to a query vector, best first."""
+        return top_k(self.vectors @ normalize(vector), k)
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    # all zero vectors (nothing activated) stay zero, and match nothing
+    return vectors / np.maximum(norms, 1e-12)
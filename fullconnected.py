@@ -1,36 +1,38 @@
-import json
-
-import numpy as np
 from tensorflow import keras
 
-with open('training/naive-mar2019_861k_spell.json') as f:
-    data = json.load(f)
+import training_pipeline
+from preprocess import MAGIC_2, load_dataset
+
+data = load_dataset('training/naive-mar2019_861k_spell')
 
-train_queries = np.array([spell['x'] for spell in data])
-train_labels = np.array([spell['y'] for spell in data])
+train_queries = training_pipeline.token_inputs(data['x2'], MAGIC_2)
+train_labels = training_pipeline.row_labels(data['y'])
+num_rows = len(data['x2'])
 
-print(f"X shape: {train_queries.shape}")
-print(f"Y shape: {train_labels.shape}")
+print(f"X shape: {data['x2'].shape}")
+print(f"Y shape: {data['y'].shape}")
 
 model = keras.Sequential([
     keras.layers.Dense(128, activation='relu'),
-    keras.layers.Dense(501, activation='softmax')
+    keras.layers.Dense(int(data['num_classes']), activation='softmax')
 ])
 
 model.compile(optimizer=keras.optimizers.Adam(lr=0.002),
               loss='sparse_categorical_crossentropy',
               metrics=['accuracy'])
 
-model.fit(x=train_queries, y=train_labels, epochs=15, validation_split=0.03,
-          callbacks=[
-              keras.callbacks.TensorBoard(log_dir='./logs', histogram_freq=0, batch_size=32, write_graph=True,
-                                          write_grads=True, write_images=True, update_freq='epoch'),
-              keras.callbacks.EarlyStopping('val_loss', min_delta=-0.005, patience=10, verbose=1)
-          ])
+callbacks = [
+    keras.callbacks.TensorBoard(log_dir='./logs', histogram_freq=0, batch_size=32, write_graph=True,
+                                write_grads=True, write_images=True, update_freq='epoch'),
+    keras.callbacks.EarlyStopping('val_loss', min_delta=-0.005, patience=10, verbose=1)
+]
+
+training_pipeline.fit(model, train_queries, train_labels, num_rows, epochs=15, validation_split=0.03,
+                      callbacks=callbacks)
 
 model.summary()
 
-test_loss, test_acc = model.evaluate(train_queries, train_labels)
+test_loss, test_acc = training_pipeline.evaluate(model, train_queries, train_labels, num_rows)
 print('Test accuracy:', test_acc)
 
 fileout = input("Save weights? (enter weight name) ")
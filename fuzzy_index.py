@@ -0,0 +1,68 @@
+"""
+Precomputed index for fuzzy name matching.
+FuzzyIndex.extract gives the same results as process.extract(query, names, scorer=fuzz.ratio), but only runs the
+exact ratio on names whose character counts let them reach the current top results.
+fuzzywuzzy is only imported once an index is built, so that pure model searches don't pay for importing it.
+"""
+import numpy as np
+
+
+class FuzzyIndex:
+    def __init__(self, names):
+        from fuzzywuzzy import utils
+
+        self.names = list(names)
+        # process.extract runs full_process on every choice before scoring it
+        self.processed = [utils.full_process(name) for name in self.names]
+        self.lengths = np.array([len(p) for p in self.processed])
+
+        # character count matrix (name x character), used to bound each name's ratio against a query
+        self.alphabet = {c: i for i, c in enumerate(sorted(set(''.join(self.processed))))}
+        self.counts = np.zeros((len(self.names), len(self.alphabet)), dtype=np.int32)
+        for i, processed in enumerate(self.processed):
+            for c in processed:
+                self.counts[i, self.alphabet[c]] += 1
+
+    def extract(self, query, limit=5):
+        """Returns a list of (name, score), best first."""
+        from fuzzywuzzy import fuzz, utils
+
+        query = utils.full_process(query)
+        if not query:
+            # fuzz.ratio scores an empty string 0 against anything but another empty string
+            scores = np.where(self.lengths == 0, 100, 0)
+            best = np.argsort(-scores, kind='stable')[:limit]
+            return [(self.names[i], int(scores[i])) for i in best]
+
+        query_counts = np.zeros(len(self.alphabet), dtype=np.int32)
+        for c in query:
+            if c in self.alphabet:
+                query_counts[self.alphabet[c]] += 1
+
+        # ratio is 2 * matches / total length, and a name can't match more characters than it shares with the query
+        common = np.minimum(self.counts, query_counts).sum(axis=1)
+        bounds = np.ceil(200 * common / (self.lengths + len(query)) + 1e-9)
+        order = np.lexsort((np.arange(len(self.names)), -bounds))
+
+        best = []
+        for i in order:
+            if len(best) >= limit and bounds[i] < best[-1][0]:
+                break
+            score = fuzz.ratio(query, self.processed[i])
+            if len(best) < limit or (-score, i) < (-best[-1][0], best[-1][1]):
+                best.append((score, i))
+                # stable on index, the order heapq.nlargest gives in process.extract
+                best.sort(key=lambda e: (-e[0], e[1]))
+                del best[limit:]
+        return [(self.names[i], score) for score, i in best]
+
+
+_indices = {}
+
+
+def fuzzy_index_for(choices):
+    """Returns the FuzzyIndex over the names of a list of choices, building it on first use."""
+    key = id(choices)
+    if key not in _indices or _indices[key][0] is not choices:
+        _indices[key] = (choices, FuzzyIndex([c['name'] for c in choices]))
+    return _indices[key][1]
@@ -1,18 +1,35 @@
+import time
+
+START = time.perf_counter()
+
 import json
+import sys
 
 import numpy as np
-import tensorflow as tf
 
+from numpy_model import load_model
 from preprocess import clean, tokenize, MAGIC_1, MAGIC_2
+from ranking import top_k
+from search_bundle import load_bundle
+
+IMPORTS_TOOK = time.perf_counter() - START
 
 modelname = input("Model: ")
-model = tf.keras.models.load_model(f'models/{modelname}.h5')
+if 'tf' in sys.argv:
+    model = load_model(modelname, True)
+    with open('preprocessing/map-mar2019_861k_spell.json') as f:
+        map_ = json.load(f)
+    names = [map_[str(i)] for i in range(len(map_))]
+else:
+    # the model, map and choices all come from one file (see search_bundle.py)
+    bundle, phases = load_bundle(modelname)
+    model = bundle.model
+    names = [c['name'] for c in bundle.choices]
+    print(f"Cold start: {IMPORTS_TOOK + sum(phases.values()):.3f}s (imports_s={IMPORTS_TOOK:.3f}, "
+          f"{', '.join(f'{k}={v:.3f}' for k, v in phases.items())})")
 
 model.summary()
 
-with open('preprocessing/map-mar2019_861k_spell.json') as f:
-    map_ = json.load(f)
-
 
 def get_predictions(query, model_name, magic_string):
     query = clean(query)
@@ -22,12 +39,9 @@ def get_predictions(query, model_name, magic_string):
         query = np.expand_dims(query, 2)
 
     prediction = model.predict(query)
-    prediction = prediction[0]
-
-    indexed = list(enumerate(prediction))
-    weighted = sorted(indexed, key=lambda e: e[1], reverse=True)
+    indices, scores = top_k(prediction[0], 10)
 
-    print('\n'.join([f"{map_[str(r[0])]}: {r[1]:.2f}" for r in weighted[:10]]))
+    print('\n'.join([f"{names[i]}: {score:.2f}" for i, score in zip(indices, scores)]))
     print()
 
 
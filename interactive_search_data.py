@@ -1,23 +1,26 @@
 import json
 
-from preprocess import MAGIC_2, clean, tokenize
+import numpy as np
+
+from preprocess import MAGIC_2, clean, dense_labels, load_dataset, tokenize
 
 if __name__ == '__main__':
-    with open('training/2-mar2019_861k_spell.json') as f:
-        data = json.load(f)
+    data = load_dataset('training/mar2019_861k_spell')
+    labels = dense_labels(data)
     with open('preprocessing/map-mar2019_861k_spell.json') as f:
         map_ = json.load(f)
 
     while True:
-        token_to_find = tokenize(clean(input("Query? ")), MAGIC_2)
-        entry = next((d for d in data if d['x'] == token_to_find), None)
-        if not entry:
+        token_to_find = tokenize(clean(input("Query? ")), MAGIC_2, True)
+        matches = np.flatnonzero((data['x2'] == token_to_find).all(axis=1))
+        if not len(matches):
             print("Token not found")
             continue
+        y = labels[matches[0]]
         print(f"X: {token_to_find}")
         print("Y:")
-        print(entry['y'])
-        for y, w in enumerate(entry['y']):
+        print(y.tolist())
+        for i, w in enumerate(y):
             if w:
-                print(f"{map_.get(str(y))}: {w}")
+                print(f"{map_.get(str(i))}: {w}")
         print()
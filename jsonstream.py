@@ -0,0 +1,112 @@
+"""
+Helpers to read and write large JSON files one entry at a time.
+Reads either a top-level JSON array or JSON lines (one value per line).
+"""
+import json
+
+CHUNK_SIZE = 1 << 16
+
+
+def iter_json_file(path):
+    """Yields each entry of a JSON array or JSON lines file."""
+    with open(path) as f:
+        first = ''
+        while not first:
+            c = f.read(1)
+            if not c:
+                return
+            first = c.strip()
+        f.seek(0)
+        if first == '[':
+            yield from iter_json_array(f)
+        else:
+            yield from iter_json_lines(f)
+
+
+def iter_json_lines(f):
+    for line in f:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def iter_json_array(f):
+    """Yields each entry of a top-level JSON array without reading the whole file."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    pos = 0
+    eof = False
+
+    def fill():
+        nonlocal buffer, pos, eof
+        chunk = f.read(CHUNK_SIZE)
+        if not chunk:
+            eof = True
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def skip_whitespace():
+        nonlocal pos
+        while True:
+            while pos < len(buffer) and buffer[pos].isspace():
+                pos += 1
+            if pos < len(buffer) or eof:
+                return
+            fill()
+
+    skip_whitespace()
+    if buffer[pos:pos + 1] != '[':
+        raise ValueError("Expected a JSON array")
+    pos += 1
+
+    skip_whitespace()
+    if buffer[pos:pos + 1] == ']':
+        return
+
+    while True:
+        skip_whitespace()
+        if buffer[pos:pos + 1] not in '{["' and not eof and ',' not in buffer[pos:] and ']' not in buffer[pos:]:
+            # numbers and literals have no closing character, so make sure the whole value has been read
+            fill()
+            continue
+        try:
+            entry, end = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            fill()
+            continue
+        pos = end
+        yield entry
+
+        skip_whitespace()
+        separator = buffer[pos:pos + 1]
+        pos += 1
+        if separator == ']':
+            return
+        if separator != ',':
+            raise ValueError(f"Expected ',' or ']' in JSON array, got {separator!r}")
+
+
+class JsonArrayWriter:
+    """Writes a JSON array one entry at a time. The output is the same as json.dump of the whole list."""
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.path, 'w')
+        self._file.write('[')
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._file.write(']')
+        self._file.close()
+
+    def write(self, entry):
+        if self.count:
+            self._file.write(', ')
+        self._file.write(json.dumps(entry))
+        self.count += 1
@@ -0,0 +1,139 @@
+"""
+Registry of every searchable category, so one process can serve all of them.
+Categories ([BATCH]_[TYPE], or srd-[BATCH]_[TYPE]) are found from preprocessing/map-*.json. Their models are
+models/[CATEGORY]-[NAME].(h5|npz); models without a category prefix belong to spell_evaluation.CATEGORY and to its
+srd category, like the models evaluated by spell_evaluation.py with and without srd.
+
+Models and choices are loaded the first time a category is searched, and evicted when they haven't been used for
+IDLE_TIMEOUT seconds or when more than MAX_LOADED are loaded. All categories share the same tokenizer tables.
+"""
+import collections
+import glob
+import os
+import time
+
+import numpy_model
+from preprocess import MAGIC_1, MAGIC_2
+from spell_evaluation import CATEGORY, load_choices, mixed_model, pure_model
+
+MAX_LOADED = 8
+IDLE_TIMEOUT = 30 * 60
+PREFERRED_MODEL = 'magic1_embedding_conv_maxpool'
+
+
+class UnknownModelError(KeyError):
+    """There is no such category, or no such model (or no model at all) for it."""
+
+
+def discover_categories():
+    """Returns a dict of category -> set of model names."""
+    categories = {os.path.basename(path)[len('map-'):-len('.json')]: set()
+                  for path in glob.glob('preprocessing/map-*.json')}
+    # longest first, so that a model is matched with the most specific category
+    prefixes = sorted(categories, key=len, reverse=True)
+    for path in glob.glob('models/*.h5') + glob.glob('models/*.npz'):
+        name = os.path.splitext(os.path.basename(path))[0]
+        category = next((c for c in prefixes if name.startswith(f"{c}-")), None)
+        for c in [category] if category else [CATEGORY, f"srd-{CATEGORY}"]:
+            if c in categories:
+                categories[c].add(name)
+    return categories
+
+
+class LoadedCategory:
+    def __init__(self, category, model_name, model, choices):
+        self.category = category
+        self.model_name = model_name
+        self.model = model
+        self.choices = choices
+        # the architecture part of the model name decides its input format (see spell_evaluation.prepare_input)
+        self.arch = model_name[len(category) + 1:] if model_name.startswith(f"{category}-") else model_name
+        self.magic_string = MAGIC_1 if self.arch.startswith('magic1') else MAGIC_2
+        self.last_used = time.time()
+        self.batcher = None  # set by search_server
+
+
+class ModelRegistry:
+    def __init__(self, max_loaded=MAX_LOADED, idle_timeout=IDLE_TIMEOUT, use_tf=False):
+        self.max_loaded = max_loaded
+        self.idle_timeout = idle_timeout
+        self.use_tf = use_tf
+        self.categories = discover_categories()
+        self._loaded = collections.OrderedDict()  # (category, model name) -> LoadedCategory
+        self._output_sizes = {}  # model name -> number of outputs
+        self._num_results = {}  # category -> number of results
+
+    def output_size(self, model_name):
+        """The number of outputs of a model, read from its export if it has one. Cached."""
+        if model_name not in self._output_sizes:
+            if os.path.exists(f'models/{model_name}.npz') and not self.use_tf:
+                numpy_model.ensure_exported(model_name)
+                self._output_sizes[model_name] = numpy_model.exported_output_size(model_name)
+            else:
+                self._output_sizes[model_name] = numpy_model.load_model(model_name, self.use_tf).output_shape[-1]
+        return self._output_sizes[model_name]
+
+    def num_results(self, category):
+        if category not in self._num_results:
+            self._num_results[category] = len(self.load_choices(category))
+        return self._num_results[category]
+
+    def load_choices(self, category):
+        srd = category.startswith('srd-')
+        return load_choices(category[len('srd-'):] if srd else category, srd)
+
+    def default_model(self, category):
+        """
+        The category's preferred model, otherwise its first by name, out of its models with an output per result (an
+        unprefixed model may have been trained on either the full or the srd results).
+        """
+        if not self.categories[category]:
+            raise UnknownModelError(f"There are no models for {category}")
+        models = sorted(m for m in self.categories[category] if self.output_size(m) == self.num_results(category))
+        if not models:
+            raise UnknownModelError(f"None of the models for {category} have an output for each of its "
+                                    f"{self.num_results(category)} results")
+        return next((m for m in models if m.endswith(PREFERRED_MODEL)), models[0])
+
+    def get(self, category, model_name=None):
+        """Returns the LoadedCategory for a category and model (by default, its preferred one), loading it if needed."""
+        if category not in self.categories:
+            raise UnknownModelError(f"Unknown category {category}")
+        model_name = model_name or self.default_model(category)
+        if model_name not in self.categories[category]:
+            raise UnknownModelError(f"Unknown model {model_name} for {category}")
+        self.evict_idle()
+
+        key = (category, model_name)
+        if key in self._loaded:
+            self._loaded.move_to_end(key)
+            loaded = self._loaded[key]
+            loaded.last_used = time.time()
+            return loaded
+
+        # checked before loading, so that a model that doesn't fit isn't loaded again on every request
+        if self.output_size(model_name) != self.num_results(category):
+            raise UnknownModelError(f"{model_name} has {self.output_size(model_name)} outputs, but {category} has "
+                                    f"{self.num_results(category)} results")
+        start = time.time()
+        choices = self.load_choices(category)
+        loaded = LoadedCategory(category, model_name, numpy_model.load_model(model_name, self.use_tf), choices)
+        print(f"Loaded {model_name} for {category} in {time.time() - start:.2f} seconds")
+        self._loaded[key] = loaded
+        while len(self._loaded) > self.max_loaded:
+            self._loaded.popitem(last=False)
+        return loaded
+
+    def evict_idle(self):
+        cutoff = time.time() - self.idle_timeout
+        for key in [k for k, loaded in self._loaded.items() if loaded.last_used < cutoff]:
+            del self._loaded[key]
+
+    def loaded(self):
+        """Returns the currently loaded LoadedCategory objects, least recently used first."""
+        return list(self._loaded.values())
+
+    def search(self, category, query, mode='pure', model_name=None, return_weights=False):
+        loaded = self.get(category, model_name)
+        search = mixed_model if mode == 'mixed' else pure_model
+        return search(loaded.choices, query, loaded.model, loaded.magic_string, loaded.arch, return_weights)
@@ -0,0 +1,283 @@
+"""
+Exports trained Keras models to a compact .npz file, and runs them with NumPy alone.
+Input: a trained model (in models/[NAME].h5)
+Output: the model's weights and layer configs, in models/[NAME].npz
+
+NumpyModel.predict reproduces keras' model.predict without importing TensorFlow.
+With quantize, also writes an int8 copy of the model to models/[NAME]-int8.npz: Dense and Conv1D kernels are stored as
+int8 with a float32 scale per output channel. They are converted back to float32 when the file is loaded, so this only
+makes the file smaller: the loaded model takes the same memory and time as the float32 one, with int8 precision.
+"""
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# layers that do nothing at inference time
+SKIPPED_LAYERS = {'InputLayer', 'Dropout', 'SpatialDropout1D'}
+SUPPORTED_LAYERS = {'Embedding', 'Conv1D', 'MaxPooling1D', 'AveragePooling1D', 'GlobalAveragePooling1D',
+                    'GlobalMaxPooling1D', 'Flatten', 'Dense'}
+
+
+def relu(x):
+    return np.maximum(x, 0)
+
+
+def softmax(x):
+    e = np.exp(x - x.max(axis=-1, keepdims=True))
+    return e / e.sum(axis=-1, keepdims=True)
+
+
+def sigmoid(x):
+    return 1. / (1. + np.exp(-x))
+
+
+ACTIVATIONS = {
+    'linear': lambda x: x,
+    'relu': relu,
+    'softmax': softmax,
+    'sigmoid': sigmoid,
+    'tanh': np.tanh
+}
+
+
+def export_model(name):
+    """Dumps the weights of models/[name].h5 to models/[name].npz. Returns the Keras model."""
+    from tensorflow import keras
+
+    model = keras.models.load_model(f'models/{name}.h5')
+    configs = []
+    arrays = {}
+    for layer in model.layers:
+        kind = type(layer).__name__
+        if kind in SKIPPED_LAYERS:
+            continue
+        if kind not in SUPPORTED_LAYERS:
+            raise ValueError(f"Layer {layer.name} ({kind}) is not supported by NumpyModel")
+        config = layer.get_config()
+        if config.get('padding', 'valid') != 'valid' and 'Pooling' in kind:
+            raise ValueError(f"Layer {layer.name} uses {config['padding']} padding, which is not supported")
+
+        i = len(configs)
+        weight_names = ['embeddings'] if kind == 'Embedding' else ['kernel', 'bias']
+        weight_names = weight_names[:len(layer.get_weights())]
+        for weight_name, weight in zip(weight_names, layer.get_weights()):
+            arrays[f"{i}-{weight_name}"] = weight.astype(np.float32)
+        configs.append({
+            'kind': kind,
+            'name': layer.name,
+            'weights': weight_names,
+            'activation': config.get('activation', 'linear'),
+            'padding': config.get('padding', 'valid'),
+            'strides': config['strides'][0] if 'strides' in config else None,
+            'pool_size': config['pool_size'][0] if 'pool_size' in config else None
+        })
+
+    np.savez(f'models/{name}.npz', config=np.array(json.dumps(configs)), **arrays)
+    return model
+
+
+def export_is_stale(name):
+    """Whether models/[name].h5 has been saved since it was exported to models/[name].npz."""
+    h5 = f'models/{name}.h5'
+    return os.path.exists(h5) and os.path.getmtime(h5) > os.path.getmtime(f'models/{name}.npz')
+
+
+def ensure_exported(name):
+    """Exports models/[name].h5 to models/[name].npz if it hasn't been exported yet, or has changed since."""
+    if not os.path.exists(f'models/{name}.npz') or export_is_stale(name):
+        print(f"Exporting models/{name}.h5...")
+        export_model(name)
+
+
+def quantize_model(name):
+    """Writes an int8 copy of models/[name].npz (exported from models/[name].h5 first if needed). Returns it."""
+    ensure_exported(name)
+    model = NumpyModel.load(f'models/{name}.npz').quantize()
+    model.save(f'models/{name}-int8.npz')
+    return model
+
+
+def quantize_kernel(kernel):
+    """Symmetric int8 quantization with one scale per output channel (the last axis). Returns (kernel, scale)."""
+    scale = np.abs(kernel).reshape(-1, kernel.shape[-1]).max(axis=0) / 127
+    scale[scale == 0] = 1
+    return np.round(kernel / scale).astype(np.int8), scale.astype(np.float32)
+
+
+def load_model(name, use_tf=False):
+    """
+    Loads models/[name].npz as a NumpyModel if it has been exported, otherwise the Keras model.
+    An export older than models/[name].h5 is exported again first.
+    """
+    if os.path.exists(f'models/{name}.npz') and not use_tf:
+        ensure_exported(name)
+        return NumpyModel.load(f'models/{name}.npz')
+    from tensorflow import keras
+    return keras.models.load_model(f'models/{name}.h5')
+
+
+def exported_output_size(name):
+    """The number of outputs of models/[name].npz, read without loading the rest of its weights."""
+    with np.load(f'models/{name}.npz') as data:
+        configs = json.loads(str(data['config']))
+        return data[f"{len(configs) - 1}-kernel"].shape[-1]
+
+
+class NumpyModel:
+    def __init__(self, configs, weights):
+        """
+        :param configs: A list of layer configs, in order.
+        :param weights: A list of dicts (weight name -> array), one per layer.
+        """
+        self.configs = configs
+        self.weights = weights
+
+    @classmethod
+    def load(cls, path):
+        """Loads an exported model, converting int8 kernels back to float32."""
+        with np.load(path) as data:
+            configs = json.loads(str(data['config']))
+            weights = [{w: data[f"{i}-{w}"] for w in config['weights']} for i, config in enumerate(configs)]
+        return cls(configs, weights).dequantize()
+
+    def save(self, path, **extra):
+        """Saves the model in the exported .npz format, along with any extra arrays."""
+        arrays = {f"{i}-{w}": arr for i, weights in enumerate(self.weights) for w, arr in weights.items()}
+        np.savez(path, config=np.array(json.dumps(self.configs)), **arrays, **extra)
+
+    def quantize(self):
+        """Returns a copy of this model with int8 Dense and Conv1D kernels (see quantize_kernel)."""
+        configs = []
+        weights = []
+        for config, layer_weights in zip(self.configs, self.weights):
+            if config['kind'] in ('Dense', 'Conv1D') and layer_weights['kernel'].dtype != np.int8:
+                layer_weights = dict(layer_weights)
+                layer_weights['kernel'], layer_weights['kernel_scale'] = quantize_kernel(layer_weights['kernel'])
+                config = dict(config, weights=config['weights'] + ['kernel_scale'])
+            configs.append(config)
+            weights.append(layer_weights)
+        return NumpyModel(configs, weights)
+
+    def dequantize(self):
+        """Returns a copy of this model with its int8 kernels converted back to float32 (or itself if it has none)."""
+        if not any('kernel_scale' in weights for weights in self.weights):
+            return self
+        configs = []
+        weights = []
+        for config, layer_weights in zip(self.configs, self.weights):
+            if 'kernel_scale' in layer_weights:
+                layer_weights = dict(layer_weights)
+                scale = layer_weights.pop('kernel_scale')
+                layer_weights['kernel'] = layer_weights['kernel'].astype(np.float32) * scale
+                config = dict(config, weights=[w for w in config['weights'] if w != 'kernel_scale'])
+            configs.append(config)
+            weights.append(layer_weights)
+        return NumpyModel(configs, weights)
+
+    @property
+    def output_shape(self):
+        """Like keras' model.output_shape, for the last (Dense) layer."""
+        return (None, self.weights[-1]['kernel'].shape[-1])
+
+    @property
+    def nbytes(self):
+        """Size of the weights as stored (in memory, or in an exported file)."""
+        return sum(w.nbytes for weights in self.weights for w in weights.values())
+
+    def predict(self, x, batch_size=None):
+        return self._run(x, batch_size, len(self.configs))
+
+    def features(self, x, batch_size=None):
+        """Returns the activations going into the output layer (after the Flatten), one vector per input."""
+        return self._run(x, batch_size, len(self.configs) - 1)
+
+    def _run(self, x, batch_size, num_layers):
+        x = np.asarray(x)
+        if batch_size is None or len(x) <= batch_size:
+            return self._forward(x, num_layers)
+        return np.concatenate([self._forward(x[i:i + batch_size], num_layers)
+                               for i in range(0, len(x), batch_size)])
+
+    def _forward(self, x, num_layers=None):
+        for config, weights in zip(self.configs[:num_layers], self.weights):
+            kind = config['kind']
+            if kind == 'Embedding':
+                x = weights['embeddings'][x.astype(np.intp)]
+            elif kind == 'Conv1D':
+                x = conv1d(x.astype(np.float32), weights['kernel'], config['strides'], config['padding'])
+                if 'bias' in weights:
+                    x = x + weights['bias']
+            elif kind == 'Dense':
+                x = np.dot(x.astype(np.float32), weights['kernel'])
+                if 'bias' in weights:
+                    x = x + weights['bias']
+            elif kind in ('MaxPooling1D', 'AveragePooling1D'):
+                x = pool1d(x, config['pool_size'], config['strides'] or config['pool_size'],
+                           np.max if kind == 'MaxPooling1D' else np.mean)
+            elif kind == 'GlobalAveragePooling1D':
+                x = x.mean(axis=1)
+            elif kind == 'GlobalMaxPooling1D':
+                x = x.max(axis=1)
+            elif kind == 'Flatten':
+                x = x.reshape(len(x), -1)
+            x = ACTIVATIONS[config['activation']](x)
+        return x
+
+    def summary(self):
+        print(f"{'Layer':<30}{'Kind':<25}Params")
+        for config, weights in zip(self.configs, self.weights):
+            print(f"{config['name']:<30}{config['kind']:<25}{sum(w.size for w in weights.values())}")
+
+
+def conv1d(x, kernel, strides, padding):
+    """x: (batch, steps, channels), kernel: (kernel_size, channels, filters)"""
+    kernel_size = kernel.shape[0]
+    steps = x.shape[1]
+    if padding == 'same':
+        out_steps = -(-steps // strides)
+        total = max((out_steps - 1) * strides + kernel_size - steps, 0)
+        x = np.pad(x, ((0, 0), (total // 2, total - total // 2), (0, 0)))
+    else:
+        out_steps = (steps - kernel_size) // strides + 1
+    end = (out_steps - 1) * strides + 1
+    return sum(np.dot(x[:, j:j + end:strides], kernel[j]) for j in range(kernel_size))
+
+
+def pool1d(x, pool_size, strides, reduce):
+    out_steps = (x.shape[1] - pool_size) // strides + 1
+    end = (out_steps - 1) * strides + 1
+    windows = np.stack([x[:, j:j + end:strides] for j in range(pool_size)])
+    return reduce(windows, axis=0)
+
+
+if __name__ == '__main__':
+    name = input("Model name? ").strip()
+    keras_model = export_model(name)
+    numpy_model = NumpyModel.load(f'models/{name}.npz')
+    numpy_model.summary()
+
+    # sanity check against keras on random input
+    input_shape = (256,) + tuple(keras_model.input_shape[1:])
+    if numpy_model.configs[0]['kind'] == 'Embedding':
+        test_x = np.random.randint(0, len(numpy_model.weights[0]['embeddings']), size=input_shape)
+    else:
+        test_x = np.random.rand(*input_shape)
+    diff = np.abs(keras_model.predict(test_x) - numpy_model.predict(test_x)).max()
+    print(f"Max difference from keras: {diff:.2e}")
+
+    test_x = test_x[:1]
+    start = time.time()
+    for _ in range(100):
+        numpy_model.predict(test_x)
+    print(f"Single query latency: {(time.time() - start) * 10:.3f}ms")
+
+    if 'quantize' in sys.argv:
+        quantize_model(name)
+        quantized = NumpyModel.load(f'models/{name}-int8.npz')
+        diff = np.abs(keras_model.predict(test_x) - quantized.predict(test_x)).max()
+        print(f"int8: models/{name}-int8.npz is {os.path.getsize(f'models/{name}-int8.npz') / 1024:.1f}KB "
+              f"(float32: {os.path.getsize(f'models/{name}.npz') / 1024:.1f}KB), "
+              f"max difference from keras: {diff:.2e}")
@@ -0,0 +1,76 @@
+"""
+Precomputed index for exact, prefix and substring name matching.
+PartialIndex.match gives the same results, in the same order, as scanning every name for a case-insensitive exact
+match and then for names containing the query, but only checks the names that share all of the query's n-grams.
+"""
+import bisect
+import collections
+
+NGRAM_SIZE = 3
+
+
+class PartialIndex:
+    def __init__(self, names):
+        self.names = list(names)
+        self.lowered = [name.lower() for name in self.names]
+
+        self.exact_index = collections.defaultdict(list)  # lowercased name -> indices
+        for i, lowered in enumerate(self.lowered):
+            self.exact_index[lowered].append(i)
+
+        # sorted (lowercased name, index) pairs, so that the names with a prefix are a contiguous range
+        self.sorted_names = sorted((lowered, i) for i, lowered in enumerate(self.lowered))
+        self.sorted_keys = [lowered for lowered, _ in self.sorted_names]
+
+        # every 1 to NGRAM_SIZE character substring -> indices of the names that contain it
+        self.ngrams = collections.defaultdict(set)
+        for i, lowered in enumerate(self.lowered):
+            for n in range(1, NGRAM_SIZE + 1):
+                for j in range(len(lowered) - n + 1):
+                    self.ngrams[lowered[j:j + n]].add(i)
+
+    def exact(self, query):
+        """Returns the indices of the names equal to the query, ignoring case."""
+        return list(self.exact_index.get(query.lower(), ()))
+
+    def prefix(self, query):
+        """Returns the indices of the names starting with the query, ignoring case, in name order."""
+        query = query.lower()
+        start = bisect.bisect_left(self.sorted_keys, query)
+        end = start
+        while end < len(self.sorted_keys) and self.sorted_keys[end].startswith(query):
+            end += 1
+        return sorted(i for _, i in self.sorted_names[start:end])
+
+    def substring(self, query):
+        """Returns the indices of the names containing the query, ignoring case, in name order."""
+        query = query.lower()
+        if not query:
+            return list(range(len(self.names)))
+        if len(query) <= NGRAM_SIZE:
+            return sorted(self.ngrams.get(query, ()))
+
+        postings = sorted((self.ngrams.get(query[j:j + NGRAM_SIZE], set())
+                           for j in range(len(query) - NGRAM_SIZE + 1)), key=len)
+        candidates = postings[0].intersection(*postings[1:])
+        # sharing every n-gram doesn't mean they're in the right order
+        return sorted(i for i in candidates if query in self.lowered[i])
+
+    def match(self, query):
+        """Returns the names equal to the query, then the other names containing it, ignoring case."""
+        lowered = query.lower()
+        indices = self.substring(query)
+        full_matches = [self.names[i] for i in indices if self.lowered[i] == lowered]
+        partial_matches = [self.names[i] for i in indices if self.lowered[i] != lowered]
+        return full_matches + partial_matches
+
+
+_indices = {}
+
+
+def partial_index_for(choices):
+    """Returns the PartialIndex over the names of a list of choices, building it on first use."""
+    key = id(choices)
+    if key not in _indices or _indices[key][0] is not choices:
+        _indices[key] = (choices, PartialIndex([c['name'] for c in choices]))
+    return _indices[key][1]
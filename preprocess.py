@@ -2,17 +2,42 @@
 Sorts a raw type query file into mapped training data (ready to plug in to keras)
 Input: Raw type query file (in training/unprocessed/[BATCH]_[TYPE].json)
        Result objects file (in res/[TYPE].json)
-Outputs: mapped training file, in training/[BATCH]_[TYPE].json
+       or, with 'batch [BATCH]', every type query file of the batch, in parallel
+       or, with 'incremental', a new type query file to merge into everything preprocessed for its type so far
+Outputs: binary training datasets, in training/[BATCH]_[TYPE]/, training/srd-[BATCH]_[TYPE]/
+         and training/naive-[BATCH]_[TYPE]/ (JSON training files too if run with 'json')
+         evaluation file, in preprocessing/evaluation-[BATCH]_[TYPE].json
+         binary evaluation dataset, in preprocessing/evaluation-[BATCH]_[TYPE]/
          map file, in preprocessing/map-[BATCH]_[TYPE].json
+         (with 'incremental', the outputs are for the category all_[TYPE], and the merged queries are kept in
+          preprocessing/store-[TYPE].json)
 """
+import array
 import collections
+import contextlib
+import glob
 import json
+import multiprocessing
+import os
+import re
+import shutil
+import sys
 import time
 
+import numpy as np
+
+from jsonstream import JsonArrayWriter, iter_json_file
+
 MAGIC_1 = "abcdefghijklmnopqrstuvwxyz '"
 MAGIC_2 = "qwertyuiopasdfghjkl'zxcvbnm "
 # MAGIC_2 = "aqzswxdecfrvgtb hynjumkilop'"
 INPUT_LENGTH = 16
+WRITE_JSON = 'json' in sys.argv
+TOKENIZE_CHUNK_SIZE = 65536
+INCREMENTAL_BATCH = 'all'
+CLEAN_CHUNK_SIZE = 64  # characters of a query lowercased and filtered at a time
+INVALID_CHARS = re.compile(f"[^{re.escape(MAGIC_1)}]+")
+INVALID_CHARS_BATCH = re.compile(f"[^{re.escape(MAGIC_1)}\0]+")
 
 
 def load_type_query_file(name):
@@ -29,6 +54,11 @@ def load_type_query_file(name):
     return data
 
 
+def stream_type_query_file(name):
+    """Yields unprocessed type queries from a file in training/unprocessed (JSON array or JSON lines) one by one."""
+    return iter_json_file(f"training/unprocessed/{name}")
+
+
 def map_data(queries, filename):
     """
     Generates a map (i -> name) and reverse map (name -> i), and modifies queries to set result to an int.
@@ -38,18 +68,37 @@ def map_data(queries, filename):
         "result": int
     }
     """
+    mapped, reverse_map, srd_reverse_map = generate_maps(filename)
+
+    # map training
+    print("Mapping queries...")
+
+    for entry in queries:
+        res = entry['result']
+        entry['result'] = reverse_map[res]
+        entry['srd_result'] = srd_reverse_map.get(res)
+
+    print("Done mapping.")
+    return mapped, reverse_map
+
+
+def generate_maps(filename):
+    """Generates and dumps the map and SRD map. Returns the map, reverse map and SRD reverse map."""
     typename = filename.split('_')[-1]
     with open(f"res/{typename}") as f:
         result_objs = json.load(f)
-    srd_result_objs = [o for o in result_objs if o.get('srd')]
+    return dump_maps([o['name'] for o in result_objs], [o['name'] for o in result_objs if o.get('srd')], filename)
+
 
+def dump_maps(names, srd_names, filename):
+    """Dumps the map and SRD map of a list of result names. Returns the map, reverse map and SRD reverse map."""
     # generate map
     print("Generating map...")
     mapped = {}
     reverse_map = {}
-    for i, entry in enumerate(result_objs):
-        mapped[i] = entry['name']
-        reverse_map[entry['name']] = i
+    for i, name in enumerate(names):
+        mapped[i] = name
+        reverse_map[name] = i
 
     # dump map
     print("Dumping map...")
@@ -59,25 +108,16 @@ def map_data(queries, filename):
     # and SRD
     srd_mapped = {}
     srd_reverse_map = {}
-    for i, entry in enumerate(srd_result_objs):
-        srd_mapped[i] = entry['name']
-        srd_reverse_map[entry['name']] = i
+    for i, name in enumerate(srd_names):
+        srd_mapped[i] = name
+        srd_reverse_map[name] = i
 
     # dump map
     print("Dumping SRD map...")
     with open(f"preprocessing/map-srd-{filename}", 'w') as f:
         json.dump(srd_mapped, f, indent=2)
 
-    # map training
-    print("Mapping queries...")
-
-    for entry in queries:
-        res = entry['result']
-        entry['result'] = reverse_map[res]
-        entry['srd_result'] = srd_reverse_map.get(res)
-
-    print("Done mapping.")
-    return mapped, reverse_map
+    return mapped, reverse_map, srd_reverse_map
 
 
 def ensure_at_least_1(data, reverse_map):
@@ -87,17 +127,42 @@ def ensure_at_least_1(data, reverse_map):
 
 def clean_queries(data):
     print("Cleaning queries...")
-    for entry in data:
-        entry['query'] = clean(entry['query'])
+    for entry, query in zip(data, clean_batch([entry['query'] for entry in data])):
+        entry['query'] = query
     print("Done.")
 
 
 def clean(query):
-    filtered = query.lower()
-    filtered = ''.join(c for c in filtered if c in MAGIC_1)
+    """
+    Lowercases a query, drops every character that isn't in MAGIC_1 and keeps the first 16 that are left.
+    The query is read a chunk at a time and only until 16 characters are kept, so long pasted text costs no more to
+    clean than a normal query.
+    """
+    filtered = ''
+    for start in range(0, len(query), CLEAN_CHUNK_SIZE):
+        filtered += INVALID_CHARS.sub('', query[start:start + CLEAN_CHUNK_SIZE].lower())
+        if len(filtered) >= INPUT_LENGTH:
+            break
     return filtered[:INPUT_LENGTH].strip()
 
 
+def clean_batch(queries):
+    """
+    Cleans a list of queries. Returns the same as [clean(query) for query in queries], but lowercases and filters the
+    first chunk of every query in a single pass, and only goes back to clean() for long queries that need more of it.
+    """
+    if not queries:
+        return []
+    heads = '\0'.join(query[:CLEAN_CHUNK_SIZE] for query in queries)
+    filtered = INVALID_CHARS_BATCH.sub('', heads.lower()).split('\0')
+    if len(filtered) != len(queries):
+        # some query contains the separator
+        return [clean(query) for query in queries]
+    return [clean(query) if len(head) < INPUT_LENGTH and len(query) > CLEAN_CHUNK_SIZE
+            else head[:INPUT_LENGTH].strip()
+            for query, head in zip(queries, filtered)]
+
+
 def clean_dupes(data, srd=False):
     """
     Cleans up a long list of queries into what each query returned.
@@ -123,61 +188,182 @@ def clean_dupes(data, srd=False):
 
 def dump_evaluation(cleaned, filename):
     print("Writing evaluation file...")
-    out = []
-    for query, results in cleaned.items():
-        for result in results.keys():
-            out.append({'query': query, 'result': result})
-    with open(f'preprocessing/evaluation-{filename}', 'w') as f:
-        json.dump(out, f)
+    with JsonArrayWriter(f'preprocessing/evaluation-{filename}') as out:
+        for query, results in cleaned.items():
+            for result, count in results.items():
+                out.write({'query': query, 'result': result, 'count': count})
     print("Done writing evaluation.")
 
 
+def dump_evaluation_binary(cleaned, filename):
+    """
+    Writes the evaluation set as a binary dataset to preprocessing/evaluation-[name]/, one row per (query, result):
+        queries: (N,) cleaned queries, as byte strings
+        x1, x2: (N, 16) int8 token indices of each query, for MAGIC_1 and MAGIC_2
+        results, counts: the result index of each row and how many times the query returned it
+    """
+    print("Writing binary evaluation dataset...")
+    queries = [query for query, results in cleaned.items() for _ in results]
+    save_dataset(f'preprocessing/evaluation-{dataset_name(filename)}',
+                 queries=np.array([query.encode('latin-1') for query in queries], dtype=f'S{INPUT_LENGTH}'),
+                 x1=tokenize_batch(queries, MAGIC_1, True),
+                 x2=tokenize_batch(queries, MAGIC_2, True),
+                 results=np.array([r for results in cleaned.values() for r in results], dtype=np.int32),
+                 counts=np.array([c for results in cleaned.values() for c in results.values()], dtype=np.int32))
+    print("Done writing.")
+
+
 def dump_training(cleaned, filename, num_results):
     print("Formatting for training...")
-    out1 = []
-    out2 = []
-    out_embedding = []
-    for query, results in cleaned.items():
-        tokenized = tokenize(query, MAGIC_1)
-        tokenized2 = tokenize(query, MAGIC_2)
-        result_vec = generate_y_vector(results, num_results)
-        out1.append({'x': tokenized, 'y': result_vec})
-        out2.append({'x': tokenized2, 'y': result_vec})
-        out_embedding.append({'x': tokenize(query, MAGIC_1, True), 'y': result_vec})
-    with open(f'training/1-{filename}', 'w') as f:
-        json.dump(out1, f)
-    with open(f'training/2-{filename}', 'w') as f:
-        json.dump(out2, f)
-    with open(f'training/embedding-{filename}', 'w') as f:
-        json.dump(out_embedding, f)
+    with JsonArrayWriter(f'training/1-{filename}') as out1, \
+            JsonArrayWriter(f'training/2-{filename}') as out2, \
+            JsonArrayWriter(f'training/embedding-{filename}') as out_embedding:
+        for query, results in cleaned.items():
+            tokenized = tokenize(query, MAGIC_1)
+            tokenized2 = tokenize(query, MAGIC_2)
+            result_vec = generate_y_vector(results, num_results)
+            out1.write({'x': tokenized, 'y': result_vec})
+            out2.write({'x': tokenized2, 'y': result_vec})
+            out_embedding.write({'x': tokenize(query, MAGIC_1, True), 'y': result_vec})
     print("Done formatting.")
 
 
 def dump_training_2(data, filename):
     print("Formatting for naive training...")
-    out = []
-    for entry in data:
-        tokenized = tokenize(entry['query'], MAGIC_2)
-        result = entry['result']
-        out.append({'x': tokenized, 'y': result})
-    with open(f'training/naive-{filename}', 'w') as f:
-        json.dump(out, f)
+    with JsonArrayWriter(f'training/naive-{filename}') as out:
+        for entry in data:
+            out.write(naive_training_entry(entry['query'], entry['result']))
     print("Done formatting.")
 
 
+def naive_training_entry(query, result):
+    return {'x': tokenize(query, MAGIC_2), 'y': result}
+
+
 def dump_srd(cleaned, filename):
     print("Formatting for srd training...")
     with open(f"preprocessing/map-srd-{filename}", 'r') as f:
         srd_map = json.load(f)
-    out = []
-    for query, results in cleaned.items():
-        result_vec = generate_y_vector(results, len(srd_map))
-        out.append({'x': tokenize(query, MAGIC_1, True), 'y': result_vec})
-    with open(f'training/embedding-srd-{filename}', 'w') as f:
-        json.dump(out, f)
+    with JsonArrayWriter(f'training/embedding-srd-{filename}') as out:
+        for query, results in cleaned.items():
+            result_vec = generate_y_vector(results, len(srd_map))
+            out.write({'x': tokenize(query, MAGIC_1, True), 'y': result_vec})
     print("Done formatting.")
 
 
+def dump_training_binary(cleaned, filename, num_results):
+    """
+    Writes a binary training dataset to training/[name]/:
+        x1, x2: (N, 16) int8 token indices of each unique query, for MAGIC_1 and MAGIC_2
+        label_rows, label_cols, label_weights: the nonzero entries of the normalized label vectors
+        counts: how many times each query was searched, for weighting training by real traffic
+        num_classes: the length of a label vector
+    """
+    print("Writing binary training dataset...")
+    queries = list(cleaned.keys())
+    x1 = tokenize_batch(queries, MAGIC_1, True)
+    x2 = tokenize_batch(queries, MAGIC_2, True)
+    label_rows = []
+    label_cols = []
+    label_weights = []
+    counts = []
+    for row, results in enumerate(cleaned.values()):
+        total = sum(results.values())
+        counts.append(total)
+        for result, count in results.items():
+            label_rows.append(row)
+            label_cols.append(result)
+            label_weights.append(count / total)
+    save_dataset(f'training/{dataset_name(filename)}', x1=x1, x2=x2,
+                 label_rows=np.array(label_rows, dtype=np.int32),
+                 label_cols=np.array(label_cols, dtype=np.int32),
+                 label_weights=np.array(label_weights, dtype=np.float32),
+                 counts=np.array(counts, dtype=np.int32),
+                 num_classes=np.array(num_results))
+    print("Done writing.")
+
+
+def dump_naive_binary(tokens, results, filename, num_results):
+    """
+    Writes the naive (one row per raw query) binary training dataset to training/naive-[name]/.
+    tokens: buffer of int8 MAGIC_2 token indices, 16 per row
+    results: result index of each row
+    """
+    print("Writing binary naive training dataset...")
+    save_dataset(f'training/naive-{dataset_name(filename)}',
+                 x2=np.frombuffer(tokens, dtype=np.int8).reshape(-1, INPUT_LENGTH),
+                 y=np.frombuffer(results, dtype=np.int32),
+                 num_classes=np.array(num_results))
+    print("Done writing.")
+
+
+def num_srd_results(filename):
+    with open(f"preprocessing/map-srd-{filename}", 'r') as f:
+        return len(json.load(f))
+
+
+def dataset_name(filename):
+    return os.path.splitext(filename)[0]
+
+
+def save_dataset(path, **arrays):
+    """Saves a dataset as a directory of .npy files, so that each array can be memory-mapped on load."""
+    os.makedirs(path, exist_ok=True)
+    for name, arr in arrays.items():
+        np.save(os.path.join(path, f"{name}.npy"), arr)
+
+
+class NpyArrayWriter:
+    """
+    Writes a .npy file a chunk of rows at a time, without holding the array in memory. The rows go to [path].part
+    first, since the .npy header needs the final number of rows.
+    """
+
+    def __init__(self, path, dtype, row_shape=()):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.row_shape = tuple(row_shape)
+        self.count = 0
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(f"{self.path}.part", 'wb')
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._file.close()
+        if exc_type is None:
+            header = {'descr': np.lib.format.dtype_to_descr(self.dtype), 'fortran_order': False,
+                      'shape': (self.count,) + self.row_shape}
+            with open(self.path, 'wb') as f, open(f"{self.path}.part", 'rb') as part:
+                np.lib.format.write_array_header_1_0(f, header)
+                shutil.copyfileobj(part, f)
+        os.remove(f"{self.path}.part")
+
+    def write(self, rows):
+        rows = np.ascontiguousarray(rows, dtype=self.dtype).reshape((-1,) + self.row_shape)
+        self._file.write(rows.tobytes())
+        self.count += len(rows)
+
+
+def load_dataset(path, mmap_mode='r'):
+    """Loads a dataset saved by save_dataset. Returns a dict of name -> (memory-mapped) array."""
+    return {f[:-4]: np.load(os.path.join(path, f), mmap_mode=mmap_mode)
+            for f in os.listdir(path) if f.endswith('.npy')}
+
+
+def dense_labels(dataset):
+    """Builds the (N, num_classes) label matrix of a training dataset from its sparse entries."""
+    labels = np.zeros((len(dataset['x1']), int(dataset['num_classes'])), dtype=np.float32)
+    labels[dataset['label_rows'], dataset['label_cols']] = dataset['label_weights']
+    return labels
+
+
+def normalize_tokens(tokens, magic_string):
+    """Converts token indices (tokenize(..., use_index=True)) to the scaled floats of tokenize(...)."""
+    return np.asarray(tokens, dtype=np.float32) / len(magic_string)
+
+
 def tokenize(query, magic_string, use_index=False):
     num_chars = len(magic_string)
     if not use_index:
@@ -191,6 +377,37 @@ def tokenize(query, magic_string, use_index=False):
     return tokenized
 
 
+def tokenize_batch(queries, magic_string, use_index=False):
+    """
+    Tokenizes a list of cleaned queries at once. Returns a (N, 16) array with the same values as tokenize() on each
+    query: int8 indices if use_index, otherwise float32.
+    """
+    padded = ''.join(query.ljust(INPUT_LENGTH, '\0') for query in queries)
+    if len(padded) != len(queries) * INPUT_LENGTH:
+        raise ValueError(f"Queries must be cleaned to at most {INPUT_LENGTH} characters")
+    tokens = token_table(magic_string)[np.frombuffer(padded.encode('latin-1'), dtype=np.uint8)]
+    if (tokens < 0).any():
+        raise ValueError("Queries must be cleaned to only contain characters in the magic string")
+    tokens = tokens.reshape(len(queries), INPUT_LENGTH)
+    if not use_index:
+        return normalize_tokens(tokens, magic_string)
+    return tokens
+
+
+_token_tables = {}
+
+
+def token_table(magic_string):
+    """Returns a 256-entry lookup table of character code -> token index (0 for padding, -1 if not tokenizable)."""
+    if magic_string not in _token_tables:
+        table = np.full(256, -1, dtype=np.int8)
+        table[0] = 0
+        for i, char in enumerate(magic_string):
+            table[ord(char)] = i + 1
+        _token_tables[magic_string] = table
+    return _token_tables[magic_string]
+
+
 def generate_y_vector(results, num_results):
     """Given a count of results and the total number of results, returns a normalized label vector."""
     vec = [0.] * num_results
@@ -202,9 +419,63 @@ def generate_y_vector(results, num_results):
     return vec
 
 
-if __name__ == '__main__':
-    filename = input("Filename: ").strip()
-    starttime = time.time()
+def stream_preprocess(filename):
+    """
+    Preprocesses a type query file in a single streaming pass: each entry is cleaned, mapped, counted into the
+    (srd) duplicate counters and tokenized into the naive training set as it is read. The naive training set is
+    written to disk a chunk at a time, so only the unique queries and their counts are held in memory. Writes the
+    same outputs as the in-memory pipeline.
+    """
+    map_, reverse_map, srd_reverse_map = generate_maps(filename)
+
+    print(f"Streaming queries from {filename}...")
+    cleaned = collections.defaultdict(lambda: collections.Counter())
+    srd_cleaned = collections.defaultdict(lambda: collections.Counter())
+    naive_queries = []
+    naive_results = []
+    naive_path = f'training/naive-{dataset_name(filename)}'
+    os.makedirs(naive_path, exist_ok=True)
+    with contextlib.ExitStack() as stack:
+        naive = stack.enter_context(JsonArrayWriter(f'training/naive-{filename}')) if WRITE_JSON else None
+        naive_x2 = stack.enter_context(NpyArrayWriter(os.path.join(naive_path, 'x2.npy'), np.int8, (INPUT_LENGTH,)))
+        naive_y = stack.enter_context(NpyArrayWriter(os.path.join(naive_path, 'y.npy'), np.int32))
+
+        def write_naive_chunk():
+            naive_x2.write(tokenize_batch(naive_queries, MAGIC_2, True))
+            naive_y.write(naive_results)
+            naive_queries.clear()
+            naive_results.clear()
+
+        for entry in stream_type_query_file(filename):
+            query = clean(entry['query'])
+            result = reverse_map[entry['result']]
+            srd_result = srd_reverse_map.get(entry['result'])
+
+            cleaned[query][result] += 1
+            if srd_result is not None:
+                srd_cleaned[query][srd_result] += 1
+            naive_queries.append(query)
+            naive_results.append(result)
+            if len(naive_queries) >= TOKENIZE_CHUNK_SIZE:
+                write_naive_chunk()
+            if naive:
+                naive.write(naive_training_entry(query, result))
+        write_naive_chunk()
+    save_dataset(naive_path, num_classes=np.array(len(map_)))
+    print(f"Cleaned {naive_y.count} entries into {len(cleaned)} ({len(srd_cleaned)} srd).")
+    dump_evaluation(cleaned, filename)
+    dump_evaluation(srd_cleaned, f"srd-{filename}")
+    dump_evaluation_binary(cleaned, filename)
+    dump_evaluation_binary(srd_cleaned, f"srd-{filename}")
+    dump_training_binary(cleaned, filename, len(map_))
+    dump_training_binary(srd_cleaned, f"srd-{filename}", len(srd_reverse_map))
+    if WRITE_JSON:
+        dump_training(cleaned, filename, len(map_))
+        dump_srd(srd_cleaned, filename)
+
+
+def preprocess_file(filename):
+    """Preprocesses a type query file with the whole file in memory."""
     data = load_type_query_file(filename)
     map_, reverse_map = map_data(data, filename)
     # ensure_at_least_1(data, reverse_map)
@@ -213,9 +484,149 @@ if __name__ == '__main__':
     srd_cleaned = clean_dupes(data, True)
     dump_evaluation(cleaned, filename)
     dump_evaluation(srd_cleaned, f"srd-{filename}")
-    dump_training(cleaned, filename, len(map_))
-    dump_training_2(data, filename)
-    dump_srd(srd_cleaned, filename)
+    dump_evaluation_binary(cleaned, filename)
+    dump_evaluation_binary(srd_cleaned, f"srd-{filename}")
+    dump_training_binary(cleaned, filename, len(map_))
+    dump_training_binary(srd_cleaned, f"srd-{filename}", num_srd_results(filename))
+    naive_tokens = tokenize_batch([entry['query'] for entry in data], MAGIC_2, True)
+    dump_naive_binary(naive_tokens, array.array('i', (entry['result'] for entry in data)), filename, len(map_))
+    if WRITE_JSON:
+        dump_training(cleaned, filename, len(map_))
+        dump_training_2(data, filename)
+        dump_srd(srd_cleaned, filename)
+
+
+def incremental_preprocess(filename):
+    """
+    Merges a type query file into the store of every query preprocessed for its type (preprocessing/store-[TYPE].json,
+    query -> result name -> count), then regenerates the outputs of the category all_[TYPE] from the store.
+    Only the new file is read, and each file is only merged once. The result maps are append-only, so the indices of
+    existing results (and the models trained on them) stay the same when results are added to res/[TYPE].json.
+    """
+    typename = filename.split('_')[-1]
+    store = load_store(typename)
+
+    with open(f"res/{typename}") as f:
+        result_objs = json.load(f)
+    known = set(store['names'])
+    known_srd = set(store['srd_names'])
+    for o in result_objs:
+        if o['name'] not in known:
+            store['names'].append(o['name'])
+            known.add(o['name'])
+        if o.get('srd') and o['name'] not in known_srd:
+            store['srd_names'].append(o['name'])
+            known_srd.add(o['name'])
+
+    if filename in store['files']:
+        print(f"{filename} was already merged, regenerating outputs only.")
+    else:
+        print(f"Merging queries from {filename}...")
+        queries = store['queries']
+        num_entries = 0
+        for entry in stream_type_query_file(filename):
+            if entry['result'] not in known:
+                raise KeyError(f"{entry['result']} is not in res/{typename}")
+            results = queries.setdefault(clean(entry['query']), {})
+            results[entry['result']] = results.get(entry['result'], 0) + 1
+            num_entries += 1
+        store['files'].append(filename)
+        print(f"Merged {num_entries} entries, {len(queries)} unique queries in total.")
+        save_store(store, typename)
+
+    filename = f"{INCREMENTAL_BATCH}_{typename}"
+    map_, reverse_map, srd_reverse_map = dump_maps(store['names'], store['srd_names'], filename)
+    cleaned = {}
+    srd_cleaned = {}
+    for query, results in store['queries'].items():
+        cleaned[query] = collections.Counter({reverse_map[name]: count for name, count in results.items()})
+        srd_results = collections.Counter({srd_reverse_map[name]: count for name, count in results.items()
+                                           if name in srd_reverse_map})
+        if srd_results:
+            srd_cleaned[query] = srd_results
+
+    dump_evaluation(cleaned, filename)
+    dump_evaluation(srd_cleaned, f"srd-{filename}")
+    dump_evaluation_binary(cleaned, filename)
+    dump_evaluation_binary(srd_cleaned, f"srd-{filename}")
+    dump_training_binary(cleaned, filename, len(map_))
+    dump_training_binary(srd_cleaned, f"srd-{filename}", len(srd_reverse_map))
+    # the naive set has a row per search, so each unique (query, result) is repeated by its count
+    naive_queries = [query for query, results in cleaned.items() for _ in results]
+    naive_results = np.array([r for results in cleaned.values() for r in results], dtype=np.int32)
+    naive_counts = [c for results in cleaned.values() for c in results.values()]
+    naive_tokens = np.repeat(tokenize_batch(naive_queries, MAGIC_2, True), naive_counts, axis=0)
+    dump_naive_binary(naive_tokens, np.repeat(naive_results, naive_counts), filename, len(map_))
+    if WRITE_JSON:
+        dump_training(cleaned, filename, len(map_))
+        dump_srd(srd_cleaned, filename)
+
+
+def load_store(typename):
+    """Loads the incremental preprocessing store of a type, or an empty one."""
+    path = f"preprocessing/store-{typename}"
+    if not os.path.exists(path):
+        return {'files': [], 'names': [], 'srd_names': [], 'queries': {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_store(store, typename):
+    path = f"preprocessing/store-{typename}"
+    # written to a temporary file first, so that an interrupted save doesn't lose the store
+    with open(f"{path}.tmp", 'w') as f:
+        json.dump(store, f)
+    os.replace(f"{path}.tmp", path)
+
+
+def preprocess_batch(batch, processes=None):
+    """
+    Preprocesses every type query file of a batch (training/unprocessed/[BATCH]_[TYPE].json) across a process pool,
+    largest files first, and prints how long each type took.
+    """
+    paths = sorted(glob.glob(f'training/unprocessed/{batch}_*.json'), key=os.path.getsize, reverse=True)
+    filenames = [os.path.basename(path) for path in paths]
+    print(f"Preprocessing {len(filenames)} types from batch {batch}...")
+
+    timings = []
+    with multiprocessing.Pool(processes) as pool:
+        for filename, took, error in pool.imap_unordered(_preprocess_worker, filenames):
+            print(f"Finished {filename} in {took:.3f} seconds" + (f" (failed: {error})" if error else ""))
+            timings.append((filename, took, error))
+
+    print(f"{'Type':<40}{'Time':>10}")
+    for filename, took, error in sorted(timings, key=lambda t: t[1], reverse=True):
+        print(f"{filename:<40}{took:>9.3f}s" + (f"  FAILED: {error}" if error else ""))
+    print(f"Sum of per-type times: {sum(t[1] for t in timings):.3f} seconds")
+    return timings
+
+
+def _preprocess_worker(filename):
+    start = time.time()
+    try:
+        stream_preprocess(filename)
+    except Exception as e:
+        return filename, time.time() - start, f"{type(e).__name__}: {e}"
+    return filename, time.time() - start, None
+
+
+if __name__ == '__main__':
+    if 'batch' in sys.argv:
+        if sys.argv.index('batch') + 1 >= len(sys.argv):
+            print("Usage: python preprocess.py batch [BATCH]")
+            sys.exit(1)
+        filename = None
+    else:
+        filename = input("Filename: ").strip()
+    starttime = time.time()
+    if filename is None:
+        preprocess_batch(sys.argv[sys.argv.index('batch') + 1])
+    elif 'incremental' in sys.argv:
+        incremental_preprocess(filename)
+    elif 'stream' in sys.argv:
+        stream_preprocess(filename)
+    else:
+        preprocess_file(filename)
 
     endtime = time.time()
     print(f"Done! Took {endtime-starttime:.3f} seconds.")
@@ -0,0 +1,99 @@
+"""
+Optional per-stage timers for the search pipeline.
+Run spell_evaluation.py with profile to time each stage (clean, tokenize, predict, sort, fuzzy, dedup) of every
+search and print a summary after each evaluation; add cprofile to also write stats/profile-[LABEL].pstats
+(view it with python -m pstats). When profiling is off, stage() returns a shared no-op context manager.
+"""
+import bisect
+import collections
+import contextlib
+import cProfile
+import sys
+import time
+
+import numpy as np
+
+ENABLED = 'profile' in sys.argv
+CPROFILE = 'cprofile' in sys.argv
+HISTOGRAM_BUCKETS = (1e-5, 1e-4, 1e-3, 1e-2, 1e-1)  # upper bounds, in seconds
+HISTOGRAM_LABELS = ('<10us', '<100us', '<1ms', '<10ms', '<100ms', '>=100ms')
+
+_NULL_STAGE = contextlib.nullcontext()
+_timings = collections.defaultdict(list)  # stage name -> durations in seconds
+
+
+class _Stage:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        _timings[self.name].append(time.perf_counter() - self.start)
+
+
+def stage(name):
+    """Times the block it wraps as a stage, if profiling is enabled: with stage('predict'): ..."""
+    if not ENABLED:
+        return _NULL_STAGE
+    return _Stage(name)
+
+
+def reset():
+    _timings.clear()
+
+
+def histogram(durations):
+    counts = [0] * len(HISTOGRAM_LABELS)
+    for d in durations:
+        counts[bisect.bisect_right(HISTOGRAM_BUCKETS, d)] += 1
+    return counts
+
+
+def summary(total=None):
+    """Returns a table of the recorded stages: calls, cumulative time, share of total, percentiles and histogram."""
+    from tabulate import tabulate
+
+    rows = []
+    for name, durations in _timings.items():
+        durations_ms = np.array(durations) * 1000
+        p50, p95, p99 = np.percentile(durations_ms, [50, 95, 99])
+        cumulative = sum(durations)
+        rows.append([name, len(durations), cumulative, f"{cumulative / total:.1%}" if total else '',
+                     durations_ms.mean(), p50, p95, p99, ' '.join(str(c) for c in histogram(durations))])
+    rows.sort(key=lambda r: r[2], reverse=True)
+    headers = ['stage', 'calls', 'total s', 'share', 'mean ms', 'p50 ms', 'p95 ms', 'p99 ms',
+               f"histogram ({' '.join(HISTOGRAM_LABELS)})"]
+    return tabulate(rows, headers=headers, floatfmt='.3f')
+
+
+@contextlib.contextmanager
+def profiled(label):
+    """
+    Profiles everything run inside it if profiling is enabled, then prints the stage summary and, with cprofile,
+    dumps the cProfile stats to stats/profile-[LABEL].pstats.
+    """
+    if not ENABLED:
+        yield
+        return
+
+    reset()
+    profiler = cProfile.Profile() if CPROFILE else None
+    start = time.perf_counter()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+        total = time.perf_counter() - start
+        print(f"Profile of {label} ({total:.2f}s):")
+        print(summary(total) if _timings else "no instrumented stages ran")
+        if profiler:
+            profiler.dump_stats(f'stats/profile-{label}.pstats')
+            print(f"Wrote stats/profile-{label}.pstats")
+        reset()
@@ -0,0 +1,59 @@
+"""
+Ranking helpers shared by the search functions.
+top_k selects the best k entries of a prediction row (or every row of a prediction matrix) with a partial sort.
+merge_ranked merges several weighted result lists into one unique, sorted list.
+"""
+import numpy as np
+
+
+def top_k(predictions, k=10):
+    """
+    Returns (indices, scores) of the k highest scoring entries of each prediction row, best first.
+    Accepts a single row or a whole prediction matrix; ties are broken by lowest index, the same order a stable
+    descending sort gives.
+    """
+    predictions = np.asarray(predictions)
+    single = predictions.ndim == 1
+    if single:
+        predictions = np.expand_dims(predictions, 0)
+    num_classes = predictions.shape[1]
+    k = min(k, num_classes)
+
+    if k < num_classes:
+        indices = np.argpartition(-predictions, k - 1, axis=1)[:, :k]
+    else:
+        indices = np.tile(np.arange(num_classes), (predictions.shape[0], 1))
+    scores = np.take_along_axis(predictions, indices, axis=1)
+    order = np.lexsort((indices, -scores), axis=1)
+    indices = np.take_along_axis(indices, order, axis=1)
+    scores = np.take_along_axis(scores, order, axis=1)
+
+    # argpartition picks arbitrarily between entries tied with the kth score, redo those rows with a full sort
+    if k < num_classes:
+        tied = np.count_nonzero(predictions >= scores[:, -1:], axis=1) > k
+        for row in np.flatnonzero(tied):
+            indices[row] = np.argsort(-predictions[row], kind='stable')[:k]
+            scores[row] = predictions[row, indices[row]]
+
+    if single:
+        return indices[0], scores[0]
+    return indices, scores
+
+
+def merge_ranked(*ranked, limit=None):
+    """
+    Merges lists of (name, weight) into a single list sorted by weight, keeping only the first (highest weighted)
+    occurrence of each name. Earlier lists win ties.
+    """
+    merged = sorted((r for results in ranked for r in results), key=lambda e: e[1], reverse=True)
+
+    seen = set()
+    results = []
+    for name, weight in merged:
+        if name in seen:
+            continue
+        seen.add(name)
+        results.append((name, weight))
+        if limit is not None and len(results) >= limit:
+            break
+    return results
@@ -0,0 +1,122 @@
+"""
+Single-file search bundles, for answering the first query as soon as possible.
+A bundle holds an exported model's weights, the category's choice names in map order (the map is the name's position)
+and their SRD flags, in one uncompressed .npz, so that loading it parses no JSON and imports neither TensorFlow nor
+fuzzywuzzy (which is only imported by the first mixed search).
+A bundle records the modification times of the files it was built from, and is rebuilt when any of them change.
+Output: bundles/[CATEGORY]-[MODEL].npz
+Usage: python search_bundle.py build [MODEL NAME] (srd)
+       python search_bundle.py [MODEL NAME] (srd) (mixed) - interactive search from the bundle, with a cold start report
+"""
+import time
+
+START = time.perf_counter()
+
+import json
+import os
+import sys
+
+import numpy as np
+
+import numpy_model
+from preprocess import MAGIC_1, MAGIC_2
+from spell_evaluation import CATEGORY, SRD, category_file_name, load_choices, mixed_model, pure_model
+
+
+def bundle_path(model_name, category=CATEGORY, srd=SRD):
+    return f'bundles/{category_file_name(category, srd)}-{model_name}.npz'
+
+
+def bundle_sources(model_name, category=CATEGORY, srd=SRD):
+    """The files a bundle is built from -> their modification times."""
+    paths = [f'models/{model_name}.h5', f'models/{model_name}.npz', f"res/{category.split('_')[-1]}.json",
+             f'preprocessing/map-{category_file_name(category, srd)}.json']
+    return {path: os.path.getmtime(path) for path in paths if os.path.exists(path)}
+
+
+def build_bundle(model_name, category=CATEGORY, srd=SRD):
+    """Writes the bundle of a model and category, (re-)exporting models/[MODEL].h5 first if needed."""
+    numpy_model.ensure_exported(model_name)
+    model = numpy_model.NumpyModel.load(f'models/{model_name}.npz')
+    choices = load_choices(category, srd)
+    meta = {'category': category, 'srd': srd, 'model_name': model_name,
+            'sources': bundle_sources(model_name, category, srd)}
+
+    os.makedirs('bundles', exist_ok=True)
+    path = bundle_path(model_name, category, srd)
+    model.save(path, meta=np.array(json.dumps(meta)), names=np.array([c['name'] for c in choices]),
+               srd=np.array([bool(c.get('srd')) for c in choices]))
+    return path
+
+
+class SearchBundle:
+    def __init__(self, meta, names, srd, model):
+        self.category = meta['category']
+        self.model_name = meta['model_name']
+        self.model = model
+        # what the search functions expect from res/[TYPE].json
+        self.choices = [{'name': name, 'srd': is_srd} for name, is_srd in zip(names, srd)]
+        self.magic_string = MAGIC_1 if self.model_name.startswith('magic1') else MAGIC_2
+
+    @classmethod
+    def load(cls, path):
+        model = numpy_model.NumpyModel.load(path)
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            names = data['names'].tolist()
+            srd = data['srd'].tolist()
+        return cls(meta, names, srd, model)
+
+    @staticmethod
+    def load_meta(path):
+        with np.load(path) as data:
+            return json.loads(str(data['meta']))
+
+    def search(self, query, mode='pure'):
+        """Returns the top 10 (name, weight) for a query."""
+        search = mixed_model if mode == 'mixed' else pure_model
+        return search(self.choices, query, self.model, self.magic_string, self.model_name, return_weights=True)
+
+
+def load_bundle(model_name, category=CATEGORY, srd=SRD):
+    """
+    Loads a bundle, building it first if it doesn't exist yet or is out of date. Returns (bundle, seconds taken per
+    phase).
+    """
+    phases = {}
+    path = bundle_path(model_name, category, srd)
+    stale = os.path.exists(path) and \
+        SearchBundle.load_meta(path).get('sources') != bundle_sources(model_name, category, srd)
+    if stale:
+        print(f"{path} is out of date, rebuilding...")
+    if stale or not os.path.exists(path):
+        start = time.perf_counter()
+        build_bundle(model_name, category, srd)
+        phases['build_bundle_s'] = time.perf_counter() - start
+    start = time.perf_counter()
+    bundle = SearchBundle.load(path)
+    phases['load_bundle_s'] = time.perf_counter() - start
+    return bundle, phases
+
+
+if __name__ == '__main__':
+    args = [a for a in sys.argv[1:] if a not in ('build', 'srd', 'mixed')]
+    model_name = args[0] if args else input("Model name? ").strip()
+    if 'build' in sys.argv:
+        print(f"Wrote {build_bundle(model_name)}")
+        sys.exit()
+
+    mode = 'mixed' if 'mixed' in sys.argv else 'pure'
+    phases = {'imports_s': time.perf_counter() - START}
+    bundle, load_phases = load_bundle(model_name)
+    phases.update(load_phases)
+    start = time.perf_counter()
+    bundle.search('fireball', mode)
+    phases['first_query_s'] = time.perf_counter() - start
+    print(f"Cold start: {time.perf_counter() - START:.3f}s "
+          f"({', '.join(f'{k}={v:.3f}' for k, v in phases.items())})")
+
+    while True:
+        query = input("Query: ").strip()
+        print('\n'.join(f"{name}: {weight:.2f}" for name, weight in bundle.search(query, mode)))
+        print()
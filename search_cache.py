@@ -0,0 +1,84 @@
+"""
+Bounded LRU cache in front of the search functions.
+Search traffic is very skewed (a handful of spells make up a large share of all searches), so most searches can be
+answered without running the search at all.
+"""
+import collections
+import functools
+import random
+
+CACHE_SIZE = 4096
+
+
+class SearchCache:
+    def __init__(self, maxsize=CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key, default=None):
+        """Returns the cached value for key and marks it as recently used, counting a hit or a miss."""
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def hit_rate(self):
+        return self.hits / max(self.hits + self.misses, 1)
+
+
+def cached(search, cache, key=None):
+    """
+    Wraps a search function (choices, query, *args) so that its results are cached.
+    The cache key is the search function, the choices, the model arguments (by identity) and key(query).
+    :param key: Normalizes the query for the cache key. Only pass clean() for searches whose results depend on the
+                cleaned query alone (pure_model); the others also use the raw query, so by default it is used as is.
+    """
+
+    @functools.wraps(search)
+    def wrapper(choices, query, *args, **kwargs):
+        cache_key = (search.__name__, id(choices), key(query) if key else query,
+                     tuple(a if isinstance(a, str) else id(a) for a in args), tuple(sorted(kwargs.items())))
+        result = cache.get(cache_key)
+        if result is None:
+            result = search(choices, query, *args, **kwargs)
+            cache.put(cache_key, result)
+        return result
+
+    return wrapper
+
+
+def replay_hit_rate(query_counts, maxsize=CACHE_SIZE, seed=0):
+    """
+    Returns the hit rate an LRU cache of maxsize would get on a stream of searches, where each query appears as many
+    times as it was searched. The stream is shuffled with a fixed seed since the dump has no ordering.
+    :param query_counts: A dict of query -> number of searches.
+    """
+    stream = [query for query, count in query_counts.items() for _ in range(count)]
+    random.Random(seed).shuffle(stream)
+    cache = SearchCache(maxsize)
+    for query in stream:
+        if cache.get(query) is None:
+            cache.put(query, True)
+    return cache.hit_rate
@@ -0,0 +1,66 @@
+"""
+Load generator for search_server.py.
+Replays evaluation queries (weighted by how often they were searched) against a running server from many concurrent
+keep-alive connections, and reports throughput and latency percentiles.
+Usage: python search_loadgen.py [CONCURRENCY] [NUM REQUESTS] [PORT] (mixed) (srd)
+(with srd, start the server with srd too)
+"""
+import asyncio
+import random
+import sys
+import time
+import urllib.parse
+
+import numpy as np
+
+from search_server import DEFAULT_PORT, HOST
+from spell_evaluation import load_query_counts
+
+
+async def client(queries, latencies, port, mode):
+    reader, writer = await asyncio.open_connection(HOST, port)
+    try:
+        for query in queries:
+            path = f"/search?{urllib.parse.urlencode({'q': query, 'mode': mode})}"
+            start = time.perf_counter()
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {HOST}\r\n\r\n".encode())
+            await writer.drain()
+
+            await reader.readline()
+            content_length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                if name.lower() == 'content-length':
+                    content_length = int(value)
+            await reader.readexactly(content_length)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def run(concurrency, num_requests, port, mode):
+    query_counts = load_query_counts()
+    queries = random.Random(0).choices(list(query_counts.keys()), weights=list(query_counts.values()),
+                                       k=num_requests)
+    latencies = []
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(queries[i::concurrency], latencies, port, mode) for i in range(concurrency)))
+    took = time.perf_counter() - start
+
+    latencies = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+    print(f"{len(latencies)} requests from {concurrency} connections in {took:.2f} seconds "
+          f"({len(latencies) / took:.0f} requests/s)")
+    print(f"latency: p50={p50:.2f}ms p95={p95:.2f}ms p99={p99:.2f}ms max={latencies.max():.2f}ms")
+
+
+if __name__ == '__main__':
+    args = [a for a in sys.argv[1:] if a not in ('mixed', 'srd')]
+    concurrency = int(args[0]) if args else 64
+    num_requests = int(args[1]) if len(args) > 1 else 10000
+    port = int(args[2]) if len(args) > 2 else DEFAULT_PORT
+    asyncio.run(run(concurrency, num_requests, port, 'mixed' if 'mixed' in sys.argv else 'pure'))
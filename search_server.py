@@ -0,0 +1,223 @@
+"""
+Long-running local search service for every category in the model registry (see model_registry.py).
+Answers
+    GET /search?q=[QUERY]&category=[CATEGORY]&mode=[pure|mixed]&n=[N]
+with {"query": string, "results": [{"name": string, "weight": float}, ...]}, and GET /stats with service counters.
+Errors are answered with {"error": string}: 400 for a bad request, 404 for an unknown category or model, and 500 if
+the search itself fails.
+The category defaults to spell_evaluation.CATEGORY (srd-[CATEGORY] if run with srd).
+
+Queries for the same model that arrive within BATCH_WINDOW of each other are run through it as one batch.
+Usage: python search_server.py [PORT] (srd)
+"""
+import asyncio
+import json
+import sys
+import time
+import traceback
+import urllib.parse
+
+from model_registry import ModelRegistry, UnknownModelError
+from preprocess import clean
+from ranking import top_k
+from search_cache import SearchCache
+from spell_evaluation import CATEGORY, SRD, USE_TF, category_file_name, merge_mixed, mixed_candidates, prepare_input
+
+HOST = '127.0.0.1'
+DEFAULT_PORT = 8378
+BATCH_WINDOW = 0.002  # seconds to wait for more queries before running a batch
+MAX_BATCH_SIZE = 256
+MAX_RESULTS = 10
+
+
+class MicroBatcher:
+    """Gathers queries that arrive close together and runs them through the model in a single forward pass."""
+
+    def __init__(self, model, magic_string, model_name, k=MAX_RESULTS, window=BATCH_WINDOW,
+                 max_batch_size=MAX_BATCH_SIZE):
+        self.model = model
+        self.magic_string = magic_string
+        self.model_name = model_name
+        self.k = k
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self.num_batches = 0
+        self.num_queries = 0
+        self._pending = []
+        self._timer = None
+
+    async def top_k(self, query):
+        """Returns the (indices, scores) of the model's top k results for a query."""
+        future = asyncio.get_event_loop().create_future()
+        self._pending.append((query, future))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_event_loop().call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+
+        # the forward pass runs on the event loop thread: keras models can't be called from other threads,
+        # and a batch only takes a few milliseconds
+        try:
+            predictions = self.model.predict(prepare_input([q for q, _ in batch], self.magic_string, self.model_name))
+            indices, scores = top_k(predictions, self.k)
+        except Exception as e:
+            for _, future in batch:
+                if not future.cancelled():
+                    future.set_exception(e)
+            return
+        self.num_batches += 1
+        self.num_queries += len(batch)
+        for i, (_, future) in enumerate(batch):
+            if not future.cancelled():
+                future.set_result((indices[i], scores[i]))
+
+
+class SearchService:
+    def __init__(self, registry, default_category=CATEGORY):
+        self.registry = registry
+        self.default_category = default_category
+        self.cache = SearchCache()
+        self.num_requests = 0
+        self.started = time.time()
+
+    async def search(self, query, mode='pure', category=None):
+        """Returns a list of (name, weight), best first."""
+        category = category or self.default_category
+        # pure results only depend on the cleaned query, mixed ones on the raw query too
+        key = (category, mode, clean(query) if mode == 'pure' else query)
+        results = self.cache.get(key)
+        if results is not None:
+            return results
+
+        loaded = self.registry.get(category)
+        if loaded.batcher is None:
+            loaded.batcher = MicroBatcher(loaded.model, loaded.magic_string, loaded.arch,
+                                          mixed_candidates(loaded.choices, MAX_RESULTS))
+        indices, scores = await loaded.batcher.top_k(query)
+        if mode == 'mixed':
+            results = merge_mixed(loaded.choices, query, indices, scores, limit=MAX_RESULTS)
+        else:
+            results = [(loaded.choices[i]['name'], score) for i, score in zip(indices[:MAX_RESULTS], scores)]
+        self.cache.put(key, results)
+        return results
+
+    def stats(self):
+        loaded = {}
+        for entry in self.registry.loaded():
+            batcher = entry.batcher
+            loaded[entry.category] = {
+                'model': entry.model_name,
+                'batches': batcher.num_batches if batcher else 0,
+                'mean_batch_size': batcher.num_queries / max(batcher.num_batches, 1) if batcher else 0
+            }
+        return {
+            'uptime': time.time() - self.started,
+            'requests': self.num_requests,
+            'categories': sorted(self.registry.categories),
+            'loaded': loaded,
+            'cache_hits': self.cache.hits,
+            'cache_misses': self.cache.misses,
+            'cache_hit_rate': self.cache.hit_rate
+        }
+
+    async def handle(self, path):
+        """Returns (status, response object) for a request path."""
+        url = urllib.parse.urlsplit(path)
+        params = urllib.parse.parse_qs(url.query)
+        if url.path == '/stats':
+            return 200, self.stats()
+        if url.path != '/search':
+            return 404, {'error': 'not found'}
+        if 'q' not in params:
+            return 400, {'error': 'missing q'}
+
+        query = params['q'][0]
+        category = params.get('category', [self.default_category])[0]
+        if category not in self.registry.categories:
+            return 404, {'error': f'unknown category {category}'}
+        mode = params.get('mode', ['pure'])[0]
+        if mode not in ('pure', 'mixed'):
+            return 400, {'error': 'mode must be pure or mixed'}
+        try:
+            n = min(int(params.get('n', [5])[0]), MAX_RESULTS)
+        except ValueError:
+            return 400, {'error': 'n must be an integer'}
+        if n < 1:
+            return 400, {'error': 'n must be at least 1'}
+
+        self.num_requests += 1
+        try:
+            results = await self.search(query, mode, category)
+        except UnknownModelError as e:
+            return 404, {'error': str(e.args[0])}
+        return 200, {'query': query, 'results': [{'name': name, 'weight': float(weight)}
+                                                 for name, weight in results[:n]]}
+
+    async def serve_connection(self, reader, writer):
+        """Serves HTTP/1.1 requests on a connection until the client closes it."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3 or parts[0] != 'GET':
+                    status, response = 405, {'error': 'only GET is supported'}
+                else:
+                    try:
+                        status, response = await self.handle(parts[1])
+                    except Exception:
+                        traceback.print_exc()
+                        status, response = 500, {'error': 'internal error'}
+
+                body = json.dumps(response).encode()
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                             f"Content-Type: application/json\r\n"
+                             f"Content-Length: {len(body)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(service, port=DEFAULT_PORT):
+    server = await asyncio.start_server(service.serve_connection, HOST, port)
+    print(f"Serving on http://{HOST}:{port}/search?q=")
+    async with server:
+        await server.serve_forever()
+
+
+if __name__ == '__main__':
+    args = [a for a in sys.argv[1:] if a not in ('srd', 'tf')]
+    port = int(args[0]) if args else DEFAULT_PORT
+
+    registry = ModelRegistry(use_tf=USE_TF)
+    for category, models in sorted(registry.categories.items()):
+        print(f"{category}: {', '.join(sorted(models)) or 'no models'}")
+    service = SearchService(registry, category_file_name(CATEGORY, SRD))
+    try:
+        asyncio.run(serve(service, port))
+    except KeyboardInterrupt:
+        pass
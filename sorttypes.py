@@ -1,28 +1,40 @@
 """
 Sorts a data dump file into query types.
-Input: Raw query file (root dir)
+Input: Raw query file (root dir), as a JSON array or JSON lines
 Outputs: 1 query file per type, in training/unprocessed/[BATCH]_[TYPE].json
+
+Entries are streamed from the dump straight into a writer per type, so memory use doesn't depend on the dump size.
 """
-import json
+import contextlib
+import os
+import time
 
-infile = input("Infile? ")
+from jsonstream import JsonArrayWriter, iter_json_file
 
-with open(infile) as f:
-    data = json.load(f)
+PROGRESS_INTERVAL = 100000
 
-types = {}
+infile = input("Infile? ")
+batch = os.path.splitext(infile)[0]
+start = time.time()
 
-for entry in data:
-    print(f"{entry['type']}: {entry['query']} => {entry['result']}")
-    if entry['type'] not in types:
-        types[entry['type']] = []
-    types[entry['type']].append({
-        'query': entry['query'],
-        'result': entry['result']
-    })
+writers = {}
+num_entries = 0
+with contextlib.ExitStack() as stack:
+    for entry in iter_json_file(infile):
+        type_ = entry['type']
+        if type_ not in writers:
+            writers[type_] = stack.enter_context(JsonArrayWriter(f'training/unprocessed/{batch}_{type_}.json'))
+        writers[type_].write({
+            'query': entry['query'],
+            'result': entry['result']
+        })
 
-for type_, entries in types.items():
-    with open(f'training/unprocessed/{infile[:-5]}_{type_}.json', 'w') as f:
-        json.dump(entries, f, indent=2)
+        num_entries += 1
+        if num_entries % PROGRESS_INTERVAL == 0:
+            print(f"{num_entries} entries ({num_entries / (time.time() - start):.0f}/s)")
 
-print(f"Sorted {len(data)} entries into {len(types)} categories")
+took = time.time() - start
+print(f"Sorted {num_entries} entries into {len(writers)} categories in {took:.3f} seconds "
+      f"({num_entries / max(took, 0.001):.0f} entries/s)")
+for type_, writer in sorted(writers.items(), key=lambda w: w[1].count, reverse=True):
+    print(f"  {type_}: {writer.count}")
@@ -19,63 +19,115 @@ magic1_embedding_conv_smaller Pure: t1=12979 t2=1172 t3=470 t10=976 f=1330 t=39.
 magic1_embedding_conv_smaller Mixed: t1=12814 t2=961 t3=495 t10=1546 f=1111 t=163.57
 """
 
+import collections
 import json
+import multiprocessing
+import os
 import sys
 import time
 
 import numpy as np
-import tensorflow as tf
-from fuzzywuzzy import fuzz, process
-from tabulate import tabulate
 
-from preprocess import MAGIC_1, MAGIC_2, clean, tokenize
+import numpy_model
+import profiling
+from embedding_index import EmbeddingIndex
+from fuzzy_index import fuzzy_index_for
+from partial_index import partial_index_for
+from preprocess import MAGIC_1, MAGIC_2, clean, clean_batch, load_dataset, normalize_tokens, tokenize_batch
+from ranking import merge_ranked, top_k
+from search_cache import SearchCache, cached, replay_hit_rate
 
+CATEGORY = 'mar2019_861k_spell'
 SRD = 'srd' in sys.argv
+USE_TF = 'tf' in sys.argv
+BATCHED = 'unbatched' not in sys.argv
+BATCH_SIZE = 1024
+CACHE = 'cache' in sys.argv
+CACHE_SIZES = (256, 1024, 4096)
+PARALLEL = 'parallel' in sys.argv
+CASCADE = 'cascade' in sys.argv
+QUANTIZED = 'quantized' in sys.argv
+NEAREST_NEIGHBOUR = 'nn' in sys.argv
+CASCADE_THRESHOLDS = (0.5, 0.8, 0.95)
+MIN_PREFIX_LENGTH = 4
 
 
 def load_model(name):
-    model = tf.keras.models.load_model(f'models/{name}.h5')
-    return model
+    return numpy_model.load_model(name, USE_TF)
 
 
-def load_map():
+def category_file_name(category, srd):
+    """Name of a category's ([BATCH]_[TYPE]) preprocessed files."""
+    return f"srd-{category}" if srd else category
+
+
+def load_map(category=CATEGORY, srd=SRD):
     """
     Map: index -> spell name
     """
-    model_name = "mar2019_861k_spell"
-    if SRD:
-        model_name = f"srd-{model_name}"
-    with open(f'preprocessing/map-{model_name}.json') as f:
+    with open(f'preprocessing/map-{category_file_name(category, srd)}.json') as f:
         map_ = json.load(f)
     map_ = {int(k): v for k, v in map_.items()}
     reverse_map = {v: k for k, v in map_.items()}
     return map_, reverse_map
 
 
-def load_choices():
-    with open('res/spell.json') as f:
+def load_choices(category=CATEGORY, srd=SRD):
+    """
+    Result objects, in the order of the category's map. Maps of incrementally preprocessed categories are append-only,
+    so their order can differ from res/[TYPE].json, and results removed from it only have a name.
+    """
+    typename = category.split('_')[-1]
+    with open(f'res/{typename}.json') as f:
         data = json.load(f)
-    if SRD:
+    if srd:
         data = [d for d in data if d['srd']]
+    if os.path.exists(f'preprocessing/map-{category_file_name(category, srd)}.json'):
+        map_, _ = load_map(category, srd)
+        names = [map_[i] for i in range(len(map_))]
+        if names != [d['name'] for d in data]:
+            by_name = {d['name']: d for d in data}
+            data = [by_name.get(name, {'name': name}) for name in names]
     return data
 
 
-def load_evaluation_queries():
-    model_name = "mar2019_861k_spell"
-    if SRD:
-        model_name = f"srd-{model_name}"
-    with open(f'preprocessing/evaluation-{model_name}.json') as f:
+def load_evaluation_dataset(category=CATEGORY, srd=SRD):
+    """
+    Loads the binary evaluation dataset written by preprocess.py as memory-mapped arrays (queries, x1, x2, results,
+    counts), or returns None if the category was preprocessed before it was written.
+    """
+    path = f'preprocessing/evaluation-{category_file_name(category, srd)}'
+    if not os.path.isdir(path):
+        return None
+    return load_dataset(path)
+
+
+def load_evaluation_queries(category=CATEGORY, srd=SRD, dataset=None):
+    dataset = dataset if dataset is not None else load_evaluation_dataset(category, srd)
+    if dataset is not None:
+        return list(zip(np.char.decode(dataset['queries'], 'latin-1').tolist(), dataset['results'].tolist()))
+    with open(f'preprocessing/evaluation-{category_file_name(category, srd)}.json') as f:
         data = json.load(f)
     data = [(e['query'], e['result']) for e in data]
     return data
 
 
+def load_query_counts(category=CATEGORY, srd=SRD):
+    """
+    Counts: cleaned query -> number of times it was searched
+    (evaluation files written before counts were added count each result once)
+    """
+    with open(f'preprocessing/evaluation-{category_file_name(category, srd)}.json') as f:
+        data = json.load(f)
+    counts = collections.Counter()
+    for e in data:
+        counts[e['query']] += e.get('count', 1)
+    return counts
+
+
 def naive_partial_match(choices, query, return_weights=False):
     """Returns the names of the top 5 results using this search algorithm."""
-    full_matches = [s['name'] for s in choices if s['name'].lower() == query.lower()]
-    partial_matches = [s['name'] for s in choices if
-                       query.lower() in s['name'].lower() and s['name'] not in full_matches]
-    results = full_matches + partial_matches
+    results = partial_index_for(choices).match(query)
     if not return_weights:
         return results
     weights = [len(query) / len(r) for r in results]
@@ -84,72 +136,186 @@ def naive_partial_match(choices, query, return_weights=False):
 
 
 def naive_levenshtein_distance(choices, query):
-    names = [s['name'] for s in choices]
-    fuzzy_results = process.extract(query, names, scorer=fuzz.ratio)
-    sorted_weighted = sorted(fuzzy_results, key=lambda e: e[1], reverse=True)
+    with profiling.stage('fuzzy'):
+        fuzzy_results = fuzzy_index_for(choices).extract(query)
+    with profiling.stage('dedup'):
+        return [r[0] for r in merge_ranked(fuzzy_results)]
+
 
-    # build results list, unique
-    results = []
-    for r in sorted_weighted:
-        if r[0] not in results:
-            results.append(r[0])
+def prepare_input(queries, magic_string, model_name):
+    """Cleans and tokenizes a list of queries into a single input array for the given model."""
+    with profiling.stage('clean'):
+        cleaned = clean_batch(queries)
+    with profiling.stage('tokenize'):
+        return format_input(tokenize_batch(cleaned, magic_string, True), magic_string, model_name)
 
-    return results
+
+def format_input(tokens, magic_string, model_name):
+    """Converts (N, 16) token indices to the input format of the given model."""
+    if 'embedding' in model_name:
+        return tokens
+    tokens = normalize_tokens(tokens, magic_string)
+    if 'conv' in model_name:
+        tokens = np.expand_dims(tokens, 2)
+    return tokens
 
 
 def pure_model(choices, query, model, magic_string, model_name, return_weights=False):
-    query = clean(query)
-    query = tokenize(query, magic_string, 'embedding' in model_name)
-    query = np.expand_dims(query, 0)
-    if 'conv' in model_name and 'embedding' not in model_name:
-        query = np.expand_dims(query, 2)
+    query = prepare_input([query], magic_string, model_name)
 
-    prediction = model.predict(query)
-    prediction = prediction[0]
+    with profiling.stage('predict'):
+        prediction = model.predict(query)
+    with profiling.stage('sort'):
+        indices, scores = top_k(prediction[0], 10)
 
-    indexed = list(enumerate(prediction))
-    weighted = sorted(indexed, key=lambda e: e[1], reverse=True)
     if not return_weights:
-        return [choices[r[0]]['name'] for r in weighted[:10]]
-    return [(choices[r[0]]['name'], r[1]) for r in weighted[:10]]
+        return [choices[i]['name'] for i in indices]
+    return [(choices[i]['name'], score) for i, score in zip(indices, scores)]
 
 
 def mixed_model(choices, query, model, magic_string, model_name, return_weights=False):
-    names = [s['name'] for s in choices]
-    fuzzy_results = process.extract(query, names, scorer=fuzz.ratio)
+    tokenized = prepare_input([query], magic_string, model_name)
+    with profiling.stage('predict'):
+        prediction = model.predict(tokenized)
+    # any net result that makes the merged top 10 is in the net's own top 10 unique names (see mixed_candidates)
+    with profiling.stage('sort'):
+        indices, scores = top_k(prediction[0], mixed_candidates(choices))
+
+    weighted = merge_mixed(choices, query, indices, scores)
+    if not return_weights:
+        return [r[0] for r in weighted]
+    return weighted
+
+
+def merge_mixed(choices, query, indices, scores, limit=10):
+    """
+    Merges the fuzzy matches for a query with the net's top results (indices, scores) into a list of (name, weight).
+    The net's results should be its top mixed_candidates(choices, limit), so that duplicate names can't leave the
+    merged list short.
+    """
+    with profiling.stage('fuzzy'):
+        fuzzy_results = fuzzy_index_for(choices).extract(query)
     fuzzy_sum = max(sum(r[1] for r in fuzzy_results), 0.001)
     fuzzy_matches_and_confidences = [(r[0], r[1] / fuzzy_sum) for r in fuzzy_results]
 
-    # net
-    query = clean(query)
-    query = tokenize(query, magic_string, 'embedding' in model_name)
-    query = np.expand_dims(query, 0)
-    if 'conv' in model_name and 'embedding' not in model_name:
-        query = np.expand_dims(query, 2)
-
-    prediction = model.predict(query)
-    prediction = prediction[0]
-
-    indexed = list(enumerate(prediction))
-    weighted = sorted(indexed, key=lambda e: e[1], reverse=True)
-    net_weighted = [(choices[r[0]]['name'], r[1]) for r in weighted]
-
-    sorted_weighted = sorted(fuzzy_matches_and_confidences + net_weighted, key=lambda e: e[1], reverse=True)
-
-    # build results list, unique
-    results = []
-    weights = []
-    for r in sorted_weighted:
-        if r[0] not in results:
-            results.append(r[0])
-            weights.append(r[1])
+    net_weighted = [(choices[i]['name'], score) for i, score in zip(indices, scores)]
+    with profiling.stage('dedup'):
+        return merge_ranked(fuzzy_matches_and_confidences, net_weighted, limit=limit)
+
+
+_duplicate_counts = {}
+
+
+def mixed_candidates(choices, limit=10):
+    """
+    How many of the net's top results merge_mixed needs for its top limit: a result is only pushed down by the
+    higher weighted results with a different name, and by at most every choice that repeats an earlier choice's name.
+    """
+    key = id(choices)
+    if key not in _duplicate_counts or _duplicate_counts[key][0] is not choices:
+        _duplicate_counts[key] = (choices, len(choices) - len({c['name'] for c in choices}))
+    return limit + _duplicate_counts[key][1]
+
+
+def nearest_neighbour(choices, query, model, magic_string, model_name, return_weights=False):
+    """Returns the 10 choices whose names are closest to the query in the model's feature space."""
+    index = embedding_index_for(choices, model, magic_string, model_name)
+    tokenized = prepare_input([query], magic_string, model_name)
+    with profiling.stage('predict'):
+        vector = model.features(tokenized)[0]
+    with profiling.stage('nn'):
+        indices, scores = index.search(vector, 10)
+
     if not return_weights:
-        return results
-    return list(zip(results, weights))
+        return [choices[i]['name'] for i in indices]
+    return [(choices[i]['name'], score) for i, score in zip(indices, scores)]
+
+
+_embedding_indices = {}
 
 
-def evaluate(search, query_pairs, choices, model=None, reverse_map=None, magic_string=None, model_name=None):
+def embedding_index_for(choices, model, magic_string, model_name):
+    """Returns the EmbeddingIndex of a model's feature vectors of the choice names, building it on first use."""
+    if not isinstance(model, numpy_model.NumpyModel):
+        raise ValueError("Nearest neighbour search needs an exported (NumpyModel) model")
+    key = (id(choices), id(model))
+    if key not in _embedding_indices or _embedding_indices[key][0] is not choices:
+        names = [c['name'] for c in choices]
+        vectors = model.features(prepare_input(names, magic_string, model_name), batch_size=BATCH_SIZE)
+        _embedding_indices[key] = (choices, EmbeddingIndex(vectors))
+    return _embedding_indices[key][1]
+
+
+cascade_stages = collections.Counter()  # cascade stage -> number of queries it answered
+
+
+def cascade_model(choices, query, model, magic_string, model_name, return_weights=False,
+                  net_threshold=CASCADE_THRESHOLDS[1]):
+    """
+    Runs the cheapest search that is confident about the query: an exact (or unique prefix) name match, then the net
+    alone if its top score is at least net_threshold, then the mixed model. Counts the stage used in cascade_stages.
+    """
+    index = partial_index_for(choices)
+    with profiling.stage('exact'):
+        matches = index.exact(query)
+        if not matches and len(query) >= MIN_PREFIX_LENGTH:
+            matches = index.prefix(query)
+            if len(matches) != 1:
+                matches = []
+
+    if matches:
+        cascade_stages['exact'] += 1
+        names = [choices[i]['name'] for i in matches]
+        weighted = [(name, len(query) / len(name)) for name in names] \
+                   + [r for r in naive_partial_match(choices, query, return_weights=True) if r[0] not in names]
+        weighted = weighted[:10]
+    else:
+        tokenized = prepare_input([query], magic_string, model_name)
+        with profiling.stage('predict'):
+            prediction = model.predict(tokenized)
+        with profiling.stage('sort'):
+            indices, scores = top_k(prediction[0], mixed_candidates(choices))
+        if scores[0] >= net_threshold:
+            cascade_stages['net'] += 1
+            weighted = [(choices[i]['name'], score) for i, score in zip(indices[:10], scores[:10])]
+        else:
+            cascade_stages['mixed'] += 1
+            weighted = merge_mixed(choices, query, indices, scores)
+
+    if not return_weights:
+        return [r[0] for r in weighted]
+    return weighted
+
+
+def cascade_search(net_threshold):
+    """Returns cascade_model with a net threshold, as a search function for evaluate()."""
+
+    def search(choices, query, model, magic_string, model_name, return_weights=False):
+        return cascade_model(choices, query, model, magic_string, model_name, return_weights, net_threshold)
+
+    search.__name__ = f"cascade_model_{net_threshold}"
+    return search
+
+
+def evaluate(search, query_pairs, choices, model=None, reverse_map=None, magic_string=None, model_name=None,
+             cache=None):
     start = time.time()
+    with profiling.profiled(f"{search.__name__}-{model_name}" if model_name else search.__name__):
+        top_1, top_2, top_3, top_10, failed = score(search, query_pairs, choices, model, reverse_map, magic_string,
+                                                    model_name, cache)
+    end = time.time()
+
+    if model_name:
+        dump_failed(failed, model_name)
+
+    return top_1, top_2, top_3, len(failed), end - start, top_10
+
+
+def score(search, query_pairs, choices, model=None, reverse_map=None, magic_string=None, model_name=None,
+          cache=None):
+    """Runs a search over query pairs. Returns (top_1, top_2, top_3, top_10, failed queries)."""
+    if cache is not None:
+        search = cached(search, cache, key=clean if search is pure_model else None)
     top_1 = 0
     top_2 = 0
     top_3 = 0
@@ -173,29 +339,138 @@ def evaluate(search, query_pairs, choices, model=None, reverse_map=None, magic_s
             top_10 += 1
         else:
             failed.append({"query": query, "expected": expected_result_name})
+
+    return top_1, top_2, top_3, top_10, failed
+
+
+def evaluate_batched(query_pairs, choices, model, reverse_map, magic_string, model_name, batch_size=BATCH_SIZE,
+                     tokens=None):
+    """
+    Scores the pure model over all query pairs at once. Equivalent to evaluate(pure_model, ...), but runs a single
+    batched prediction over every query and computes the top-n counts from the prediction matrix.
+    :param tokens: The precomputed token indices of the queries for magic_string (x1 or x2 of the evaluation dataset).
+    """
+    start = time.time()
+    with profiling.profiled(f"batched-{model_name}"):
+        top_1, top_2, top_3, top_10, failed = score_batched(query_pairs, choices, model, reverse_map, magic_string,
+                                                            model_name, batch_size, tokens)
     end = time.time()
 
+    dump_failed(failed, model_name)
+
+    return top_1, top_2, top_3, len(failed), end - start, top_10
+
+
+def score_batched(query_pairs, choices, model, reverse_map, magic_string, model_name, batch_size=BATCH_SIZE,
+                  tokens=None):
+    """Batched version of score(pure_model, ...)."""
+    queries = [query for query, _ in query_pairs]
+    expected_names = np.array([reverse_map[expected_result] for _, expected_result in query_pairs], dtype=object)
+    names = np.array([s['name'] for s in choices], dtype=object)
+
+    if tokens is None:
+        tokenized = prepare_input(queries, magic_string, model_name)
+    else:
+        tokenized = format_input(tokens, magic_string, model_name)
+    with profiling.stage('predict'):
+        predictions = model.predict(tokenized, batch_size=batch_size)
+    with profiling.stage('sort'):
+        top_10, _ = top_k(predictions, 10)
+    hits = names[top_10] == expected_names[:, None]
+    found = hits.any(axis=1)
+    position = np.where(found, hits.argmax(axis=1), -1)
+
+    top_1 = int(np.count_nonzero(position == 0))
+    top_2 = int(np.count_nonzero(position == 1))
+    top_3 = int(np.count_nonzero(position == 2))
+    top_10 = int(np.count_nonzero(position > 2))
+    failed = [{"query": queries[i], "expected": expected_names[i]} for i in np.flatnonzero(~found)]
+    return top_1, top_2, top_3, top_10, failed
+
+
+def dump_failed(failed, model_name):
+    with open(f'stats/failed-{model_name}-eval.json', 'w') as f:
+        json.dump(failed, f, indent=2)
+
+
+SEARCH_METHODS = {
+    'partial': naive_partial_match,
+    'levenshtein': naive_levenshtein_distance,
+    'pure': pure_model,
+    'mixed': mixed_model,
+    'cascade': cascade_model,
+    'nn': nearest_neighbour
+}
+
+
+def evaluate_parallel(method, query_pairs, model_name=None, processes=None):
+    """
+    Runs evaluate() for a search method (a key of SEARCH_METHODS) with the query pairs split into one contiguous shard
+    per worker process. Each worker loads the choices, map and model once. The time returned is wall time, including
+    worker startup.
+    """
+    processes = processes or os.cpu_count()
+    shard_size = -(-len(query_pairs) // processes)
+    shards = [query_pairs[i:i + shard_size] for i in range(0, len(query_pairs), shard_size)]
+
+    start = time.time()
+    # spawn, since forking a process that has already loaded tensorflow can hang
+    with multiprocessing.get_context('spawn').Pool(len(shards), initializer=_init_evaluation_worker,
+                                                   initargs=(method, model_name)) as pool:
+        results = pool.map(_score_shard, shards)
+    end = time.time()
+
+    top_1, top_2, top_3, top_10 = (sum(r[i] for r in results) for i in range(4))
+    failed = [f for r in results for f in r[4]]
     if model_name:
-        with open(f'stats/failed-{model_name}-eval.json', 'w') as f:
-            json.dump(failed, f, indent=2)
+        dump_failed(failed, model_name)
 
     return top_1, top_2, top_3, len(failed), end - start, top_10
 
 
+_worker = {}
+
+
+def _init_evaluation_worker(method, model_name):
+    _worker['method'] = method
+    _worker['map'], _ = load_map()
+    _worker['choices'] = load_choices()
+    _worker['model_name'] = model_name
+    if model_name:
+        _worker['model'] = load_model(model_name)
+        _worker['magic_string'] = MAGIC_1 if model_name.startswith('magic1') else MAGIC_2
+
+
+def _score_shard(query_pairs):
+    method = _worker['method']
+    if 'model' not in _worker:
+        return score(SEARCH_METHODS[method], query_pairs, _worker['choices'], reverse_map=_worker['map'])
+    args = (query_pairs, _worker['choices'], _worker['model'], _worker['map'], _worker['magic_string'],
+            _worker['model_name'])
+    if method == 'pure' and BATCHED:
+        return score_batched(*args)
+    return score(SEARCH_METHODS[method], *args)
+
+
 def interactive_search(choices, models, map_, last_model, last_model_name):
+    from tabulate import tabulate
+
     if not len(models):
         print("At least 1 model must be evaluated for interactive search")
         return
+    cache = SearchCache()
+    cached_pure_model = cached(pure_model, cache, key=clean)
+    cached_mixed_model = cached(mixed_model, cache)
     while True:
         query = input("Query? ")
         top_naive_partial = naive_partial_match(choices, query, return_weights=True)[:5]
         top_models = [
-            (model_name, pure_model(choices, query, model,
+            (model_name, cached_pure_model(choices, query, model,
                                     MAGIC_1 if model_name.startswith('magic1') else MAGIC_2, model_name,
                                     return_weights=True)[:5])
             for model_name, model in models.items()
         ]
-        top_mixed = mixed_model(choices, query, last_model,
+        top_mixed = cached_mixed_model(choices, query, last_model,
                                 MAGIC_1 if last_model_name.startswith('magic1') else MAGIC_2, last_model_name,
                                 return_weights=True)[:5]
 
@@ -232,23 +507,84 @@ if __name__ == '__main__':
 
     map_, reverse_map = load_map()
     choices = load_choices()
-    query_pairs = load_evaluation_queries()
+    evaluation = load_evaluation_dataset()
+    query_pairs = load_evaluation_queries(dataset=evaluation)
 
     if 'interactive' in sys.argv:
         interactive_search(choices, models, map_, last_model, last_model_name)
+    elif PARALLEL:
+        methods = [(f"{model_name} Pure", 'pure', model_name) for model_name in models]
+        if 'nobaseline' not in sys.argv:
+            methods = [("Naive Partial Match", 'partial', None), ("Naive Levenshtein", 'levenshtein', None)] + methods
+        if last_model:
+            methods.append(("Mixed Model", 'mixed', last_model_name))
+        for label, method, model_name in methods:
+            t1, t2, t3, f, t, t10 = evaluate_parallel(method, query_pairs, model_name)
+            print(f"{label}: t1={t1} t2={t2} t3={t3} t10={t10} f={f} t={t:.2f} qps={len(query_pairs) / t:.0f}")
     else:
+        if CACHE:
+            query_counts = load_query_counts()
+            for size in CACHE_SIZES:
+                print(f"LRU cache of {size}: {replay_hit_rate(query_counts, size):.1%} hit rate "
+                      f"over {sum(query_counts.values())} replayed searches")
         if 'nobaseline' not in sys.argv:
             t1, t2, t3, f, t, t10 = evaluate(naive_partial_match, query_pairs, choices, reverse_map=map_)
             print(f"Naive Partial Match: t1={t1} t2={t2} t3={t3} t10={t10} f={f} t={t:.2f}")
             t1, t2, t3, f, t, t10 = evaluate(naive_levenshtein_distance, query_pairs, choices, reverse_map=map_)
             print(f"Naive Levenshtein: t1={t1} t2={t2} t3={t3} t10={t10} f={f} t={t:.2f}")
         for model_name, model in models.items():
-            t1, t2, t3, f, t, t10 = evaluate(pure_model, query_pairs, choices, model=model, reverse_map=map_,
-                                             model_name=model_name,
-                                             magic_string=MAGIC_1 if model_name.startswith('magic1') else MAGIC_2)
-            print(f"{model_name} Pure: t1={t1} t2={t2} t3={t3} t10={t10} f={f} t={t:.2f}")
+            magic_string = MAGIC_1 if model_name.startswith('magic1') else MAGIC_2
+            variants = [(model_name, model)]
+            # int8 only makes the exported file smaller (kernels are dequantized on load), so the variants are compared
+            # by accuracy and by the size of the weight data they export
+            stored_bytes = {}  # variant name -> bytes of weight data in its .npz
+            if QUANTIZED:
+                if isinstance(model, numpy_model.NumpyModel):
+                    quantized = model.quantize()
+                    stored_bytes[model_name] = model.nbytes
+                    stored_bytes[f"{model_name}-int8"] = quantized.nbytes
+                    variants.append((f"{model_name}-int8", quantized.dequantize()))
+                else:
+                    print(f"{model_name} is a keras model, run without tf to compare it with its int8 version")
+            for variant_name, variant in variants:
+                if BATCHED:
+                    tokens = None
+                    if evaluation is not None:
+                        tokens = evaluation['x1'] if magic_string == MAGIC_1 else evaluation['x2']
+                    t1, t2, t3, f, t, t10 = evaluate_batched(query_pairs, choices, variant, map_, magic_string,
+                                                             variant_name, tokens=tokens)
+                else:
+                    t1, t2, t3, f, t, t10 = evaluate(pure_model, query_pairs, choices, model=variant,
+                                                     reverse_map=map_, model_name=variant_name,
+                                                     magic_string=magic_string)
+                print(f"{variant_name} Pure: t1={t1} t2={t2} t3={t3} t10={t10} f={f} t={t:.2f}")
+                if len(variants) > 1:
+                    print(f"  {stored_bytes[variant_name] / 1024:.1f}KB of weight data in its .npz")
+            if NEAREST_NEIGHBOUR and not isinstance(model, numpy_model.NumpyModel):
+                print(f"{model_name} is a keras model, run without tf to evaluate its nearest neighbour search")
+            elif NEAREST_NEIGHBOUR:
+                t1, t2, t3, f, t, t10 = evaluate(nearest_neighbour, query_pairs, choices, model=model,
+                                                 reverse_map=map_, model_name=f"{model_name}-nn",
+                                                 magic_string=magic_string)
+                print(f"{model_name} NN: t1={t1} t2={t2} t3={t3} t10={t10} f={f} t={t:.2f}")
         if last_model:
+            cache = SearchCache() if CACHE else None
             t1, t2, t3, f, t, t10 = evaluate(mixed_model, query_pairs, choices, model=last_model, reverse_map=map_,
                                              model_name=last_model_name,
-                                             magic_string=MAGIC_1 if last_model_name.startswith('magic1') else MAGIC_2)
+                                             magic_string=MAGIC_1 if last_model_name.startswith('magic1') else MAGIC_2,
+                                             cache=cache)
             print(f"Mixed Model: t1={t1} t2={t2} t3={t3} t10={t10} f={f} t={t:.2f}")
+            if cache:
+                print(f"  cache: {cache.hits} hits, {cache.misses} misses ({cache.hit_rate:.1%})")
+        if last_model and CASCADE:
+            for threshold in CASCADE_THRESHOLDS:
+                cascade_stages.clear()
+                # named for the threshold, so that each run's failed queries get their own file
+                t1, t2, t3, f, t, t10 = evaluate(cascade_search(threshold), query_pairs, choices, model=last_model,
+                                                 reverse_map=map_, model_name=f"{last_model_name}-cascade-{threshold}",
+                                                 magic_string=MAGIC_1 if last_model_name.startswith('magic1')
+                                                 else MAGIC_2)
+                shares = ' '.join(f"{stage}={cascade_stages[stage] / len(query_pairs):.1%}"
+                                  for stage in ('exact', 'net', 'mixed'))
+                print(f"Cascade Model (net >= {threshold}): t1={t1} t2={t2} t3={t3} t10={t10} f={f} t={t:.2f} "
+                      f"({shares})")
@@ -0,0 +1,125 @@
+"""
+Streaming tf.data input pipeline for the training scripts.
+Batches are read by row index from a memory-mapped binary dataset (see preprocess.save_dataset), shuffled through a
+bounded buffer and prefetched, and soft labels stay sparse until their batch is built, so training memory doesn't grow
+with rows x classes.
+Training on the unique queries of a soft label dataset weighted by count_weights sees the same traffic weighting as
+training on every raw query, with one row per unique query.
+"""
+import math
+
+import numpy as np
+import tensorflow as tf
+
+from preprocess import normalize_tokens
+
+BATCH_SIZE = 32
+SHUFFLE_BUFFER = 16384
+PREFETCH_BATCHES = 4
+
+
+class SoftLabels:
+    """The normalized label vectors of rows of a binary training dataset, built from its sparse entries per batch."""
+
+    def __init__(self, dataset):
+        self.num_classes = int(dataset['num_classes'])
+        # entries are written row by row, so each row's entries are a contiguous range
+        self.offsets = np.searchsorted(dataset['label_rows'], np.arange(len(dataset['x1']) + 1))
+        self.cols = dataset['label_cols']
+        self.weights = dataset['label_weights']
+
+    def __call__(self, rows):
+        starts = self.offsets[rows]
+        lengths = self.offsets[rows + 1] - starts
+        batch_rows = np.repeat(np.arange(len(rows)), lengths)
+        entries = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+        labels = np.zeros((len(rows), self.num_classes), dtype=np.float32)
+        labels[batch_rows, self.cols[entries]] = self.weights[entries]
+        return labels
+
+
+def count_weights(dataset):
+    """
+    Returns a function of row indices -> sample weights proportional to how many times each query was searched,
+    scaled to average 1 over the dataset.
+    """
+    if 'counts' not in dataset:
+        raise ValueError("This dataset has no query counts, rerun preprocess.py to write them")
+    scale = len(dataset['counts']) / np.sum(dataset['counts'], dtype=np.int64)
+    return lambda rows: (dataset['counts'][rows] * scale).astype(np.float32)
+
+
+def token_inputs(tokens, magic_string=None, expand=False):
+    """
+    Returns a function of row indices -> model inputs for a token index array (x1 or x2 of a dataset).
+    :param magic_string: Normalize the indices for this magic string (leave unset for embedding models).
+    :param expand: Add a channel axis, for convolutional models without an embedding.
+    """
+
+    def inputs(rows):
+        x = np.asarray(tokens[rows])
+        if magic_string:
+            x = normalize_tokens(x, magic_string)
+        if expand:
+            x = np.expand_dims(x, 2)
+        return x
+
+    return inputs
+
+
+def row_labels(labels):
+    """Returns a function of row indices -> labels for an array with one label per row (y of a naive dataset)."""
+    return lambda rows: np.asarray(labels[rows])
+
+
+def batches(inputs, labels, rows, batch_size=BATCH_SIZE, shuffle=True, weights=None):
+    """
+    Returns a repeating tf.data.Dataset of (x, y) batches over the given rows, one pass over them per epoch, or of
+    (x, y, sample weight) batches if weights is given.
+    inputs, labels and weights are functions of an array of row indices -> array, like token_inputs, SoftLabels and
+    count_weights.
+    """
+    loaders = [inputs, labels] + ([weights] if weights else [])
+    samples = [loader(rows[:1]) for loader in loaders]
+
+    def load(batch_rows):
+        # in order, so that memory-mapped arrays are read sequentially
+        batch_rows = np.sort(batch_rows)
+        return [loader(batch_rows) for loader in loaders]
+
+    def load_batch(batch_rows):
+        tensors = tf.py_func(load, [batch_rows], [tf.as_dtype(sample.dtype) for sample in samples])
+        for tensor, sample in zip(tensors, samples):
+            tensor.set_shape((None,) + sample.shape[1:])
+        return tuple(tensors)
+
+    dataset = tf.data.Dataset.from_tensor_slices(rows)
+    if shuffle:
+        dataset = dataset.shuffle(min(SHUFFLE_BUFFER, len(rows)))
+    dataset = dataset.batch(batch_size).repeat()
+    return dataset.map(load_batch).prefetch(PREFETCH_BATCHES)
+
+
+def split_rows(num_rows, validation_split):
+    """Returns (train rows, validation rows), with the validation rows taken from the end like keras does."""
+    split_at = int(num_rows * (1 - validation_split))
+    rows = np.arange(num_rows)
+    return rows[:split_at], rows[split_at:]
+
+
+def fit(model, inputs, labels, num_rows, epochs, validation_split, callbacks=None, batch_size=BATCH_SIZE,
+        weights=None):
+    """model.fit over a dataset's rows, streamed through batches()."""
+    train_rows, validation_rows = split_rows(num_rows, validation_split)
+    return model.fit(batches(inputs, labels, train_rows, batch_size, weights=weights), epochs=epochs,
+                     steps_per_epoch=math.ceil(len(train_rows) / batch_size),
+                     validation_data=batches(inputs, labels, validation_rows, batch_size, shuffle=False,
+                                             weights=weights),
+                     validation_steps=math.ceil(len(validation_rows) / batch_size),
+                     callbacks=callbacks)
+
+
+def evaluate(model, inputs, labels, num_rows, batch_size=BATCH_SIZE):
+    """model.evaluate over every row of a dataset, streamed through batches()."""
+    return model.evaluate(batches(inputs, labels, np.arange(num_rows), batch_size, shuffle=False),
+                          steps=math.ceil(num_rows / batch_size))